@@ -22,6 +22,10 @@ FBAN_SUDO_TRIGGER: str = getenv("FBAN_SUDO_TRIGGER")
 
 GEMINI_API_KEY: str = getenv("GEMINI_API_KEY")
 
+GEMINI_RPM: int = int(getenv("GEMINI_RPM", 10))
+
+GEMINI_TPM: int = int(getenv("GEMINI_TPM", 250000))
+
 INDEX_EXTRA_MODULES: int = int(getenv("INDEX_EXTRA_MODULES", 0))
 
 LOAD_HANDLERS: bool = True
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+from pyrogram.errors import FloodWait, InternalServerError
+
+from app import LOGGER, Message
+
+MAX_CONCURRENCY = 4
+MAX_RETRIES = 3
+MIN_INTERVAL = 0.1
+MAX_INTERVAL = 5
+PROGRESS_INTERVAL = 10
+
+# A FloodWait on any admin action pauses every command using this executor, they share the same account limits.
+FLOOD_STATE = {"paused_until": 0.0}
+
+
+class ActionSummary:
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.done = 0
+        self.errors: dict[Any, str] = {}
+
+    @property
+    def failed(self) -> int:
+        return len(self.errors)
+
+    def format(self, action: str, noun: str = "members") -> str:
+        text = f"{action} <b>{self.done}</b>/{self.total} {noun}."
+
+        if self.errors:
+            text += f"\n<b>{self.failed}</b> failed:"
+            text += "".join(f"\n<code>{item}</code>: {error}" for item, error in list(self.errors.items())[:5])
+
+        return text
+
+
+class FloodNotice:
+    """Tells the user why a single action is stalled, pass it as on_flood to run_admin_action."""
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.notice: Message | None = None
+
+    async def __call__(self, seconds: float):
+        text = f"FloodWait: waiting {int(seconds)}s before trying again..."
+        try:
+            if self.notice is None:
+                self.notice = await self.message.reply(text)
+            else:
+                await self.notice.edit(text)
+        except Exception as e:
+            LOGGER.debug(f"Skipped flood notice: {e}")
+
+    async def delete(self):
+        if self.notice is not None:
+            await self.notice.delete()
+
+
+async def edit_progress(response: Message, text: str):
+    """Progress edits are best effort, a failed one must never stop the work it reports on."""
+    try:
+        await response.edit(text)
+    except Exception as e:
+        LOGGER.debug(f"Skipped progress edit: {e}")
+
+
+def pause_for_flood(seconds: float):
+    FLOOD_STATE["paused_until"] = max(FLOOD_STATE["paused_until"], time.monotonic() + seconds + 1)
+
+
+def get_flood_wait() -> float:
+    return FLOOD_STATE["paused_until"] - time.monotonic()
+
+
+async def wait_for_flood():
+    while (remaining := get_flood_wait()) > 0:
+        await asyncio.sleep(remaining)
+
+
+async def run_admin_action(
+    action: Callable[[], Awaitable],
+    max_retries: int = MAX_RETRIES,
+    on_flood: Callable[[float], Awaitable] | None = None,
+):
+    """
+    Runs a single admin action, waiting out FloodWaits globally and retrying server side errors with back-off.
+    Any other error is raised immediately, retrying won't fix it.
+    on_flood is awaited with the wait in seconds before sleeping through a FloodWait.
+    """
+    for attempt in range(max_retries + 1):
+        if on_flood and (remaining := get_flood_wait()) > 0:
+            await on_flood(remaining)
+
+        await wait_for_flood()
+
+        try:
+            return await action()
+
+        except FloodWait as e:
+            pause_for_flood(e.value)
+            if attempt == max_retries:
+                raise
+
+        except (InternalServerError, OSError) as e:
+            if attempt == max_retries:
+                raise
+            LOGGER.debug(f"Admin action failed, retrying: {e}")
+            await asyncio.sleep(2**attempt)
+
+
+async def run_admin_actions(
+    items: Iterable,
+    action: Callable[[Any], Awaitable],
+    concurrency: int = MAX_CONCURRENCY,
+    response: Message | None = None,
+    progress_text: str = "Processed",
+) -> ActionSummary:
+    """
+    info:
+        Applies action to every item with up to concurrency requests in flight.
+        The gap between requests doubles after each FloodWait and shrinks back after successes.
+    args:
+        response: message to edit with progress every PROGRESS_INTERVAL secs.
+    returns:
+        summary with the count of successes and the error of each failed item.
+    """
+    items = list(items)
+    summary = ActionSummary(total=len(items))
+    queue = asyncio.Queue()
+
+    for item in items:
+        queue.put_nowait(item)
+
+    state = {"interval": MIN_INTERVAL, "next_progress_at": time.monotonic() + PROGRESS_INTERVAL}
+
+    async def paced_action(item):
+        await asyncio.sleep(state["interval"])
+        try:
+            return await action(item)
+        except FloodWait:
+            state["interval"] = min(MAX_INTERVAL, state["interval"] * 2)
+            raise
+
+    async def worker():
+        while not queue.empty():
+            item = queue.get_nowait()
+
+            try:
+                await run_admin_action(lambda: paced_action(item))
+                summary.done += 1
+                state["interval"] = max(MIN_INTERVAL, state["interval"] * 0.9)
+            except Exception as e:
+                LOGGER.error(f"Admin action failed for {item}: {e}")
+                summary.errors[item] = str(e)
+
+            if response and time.monotonic() >= state["next_progress_at"]:
+                state["next_progress_at"] = time.monotonic() + PROGRESS_INTERVAL
+                await edit_progress(response, f"{progress_text} <b>{summary.done}</b>/{summary.total}...")
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(items)))))
+
+    return summary
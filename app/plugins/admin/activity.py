@@ -0,0 +1,56 @@
+import time
+from collections import Counter
+
+from app import CustomDB, Message, bot
+from app.plugins.admin.action_executor import PROGRESS_INTERVAL, edit_progress
+
+ACTIVITY_DB = CustomDB["CHAT_ACTIVITY"]
+
+
+async def get_activity_counts(chat_id: int, response: Message | None = None, rebuild: bool = False) -> Counter:
+    """
+    info:
+        Per user message counts of a chat.
+        The first call reads the whole history once, later calls only read messages newer than the last indexed one,
+        so checking thousands of members is a local lookup instead of one search call each.
+    args:
+        response: message to edit with indexing progress.
+        rebuild: ignore the stored index and re-read the whole history.
+    """
+    saved = None if rebuild else await ACTIVITY_DB.find_one({"_id": chat_id})
+
+    if saved:
+        counts = Counter({int(user_id): count for user_id, count in saved["counts"].items()})
+        last_message_id = saved["last_message_id"]
+    else:
+        counts = Counter()
+        last_message_id = 0
+
+    newest_message_id = last_message_id
+    scanned = 0
+    next_progress_at = time.monotonic() + PROGRESS_INTERVAL
+
+    async for msg in bot.get_chat_history(chat_id=chat_id):
+        if msg.id <= last_message_id:
+            break
+
+        newest_message_id = max(newest_message_id, msg.id)
+        scanned += 1
+
+        if msg.from_user and not msg.service:
+            counts[msg.from_user.id] += 1
+
+        if response and time.monotonic() >= next_progress_at:
+            next_progress_at = time.monotonic() + PROGRESS_INTERVAL
+            await edit_progress(response, f"Indexing chat activity... <b>{scanned}</b> new messages read.")
+
+    if newest_message_id != last_message_id or not saved:
+        await ACTIVITY_DB.add_data(
+            {
+                "_id": chat_id,
+                "counts": {str(user_id): count for user_id, count in counts.items()},
+                "last_message_id": newest_message_id,
+            }
+        )
+
+    return counts
@@ -1,7 +1,14 @@
+import asyncio
+import time
 from asyncio import sleep
 
 from pyrogram import raw, types, utils
-from ub_core import BOT, Message, bot
+from ub_core import BOT, LOGGER, Message, bot
+from ub_core.utils.helpers import create_chunks
+
+DIALOG_SNAPSHOT_TTL = 300
+
+PRIVILEGE_CHUNK_SIZE = 100
 
 
 async def get_folder() -> raw.types.DialogFilter | int:
@@ -47,10 +54,111 @@ async def update_folder(
     )
 
 
-async def get_dialogs():
-    current = 0
-    total = (1 << 31) - 1
-    request_limit = min(100, total)
+def get_raw_peer_id(peer: raw.base.User | raw.base.Chat) -> int:
+    if isinstance(peer, raw.types.Channel | raw.types.ChannelForbidden):
+        return utils.get_channel_id(peer.id)
+    if isinstance(peer, raw.types.Chat | raw.types.ChatForbidden):
+        return -peer.id
+    return peer.id
+
+
+def get_input_peer_id(input_peer: raw.base.InputPeer) -> int | None:
+    if isinstance(input_peer, raw.types.InputPeerChannel):
+        return utils.get_channel_id(input_peer.channel_id)
+    if isinstance(input_peer, raw.types.InputPeerChat):
+        return -input_peer.chat_id
+    if isinstance(input_peer, raw.types.InputPeerUser):
+        return input_peer.user_id
+    return None
+
+
+def get_input_peer(peer: raw.base.User | raw.base.Chat) -> raw.base.InputPeer | None:
+    """Builds the input peer from the access hash already present in the response, no resolve_peer round trip."""
+    if isinstance(peer, raw.types.Channel):
+        return raw.types.InputPeerChannel(channel_id=peer.id, access_hash=peer.access_hash or 0)
+    if isinstance(peer, raw.types.Chat):
+        return raw.types.InputPeerChat(chat_id=peer.id)
+    if isinstance(peer, raw.types.User):
+        return raw.types.InputPeerUser(user_id=peer.id, access_hash=peer.access_hash or 0)
+    return None
+
+
+def is_chat_admin(chat: raw.base.Chat) -> bool:
+    # Forbidden chats/channels carry no rights, the account was kicked or left.
+    return bool(getattr(chat, "admin_rights", None) or getattr(chat, "creator", False))
+
+
+class DialogSnapshot:
+    """Every dialog of the account, fetched once and shared by dialog scanning commands for DIALOG_SNAPSHOT_TTL."""
+
+    def __init__(self):
+        self.dialogs: list[types.Dialog] = []
+        self.input_peers: dict[int, raw.base.InputPeer] = {}
+        self.created_at = time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.created_at > DIALOG_SNAPSHOT_TTL
+
+
+DIALOG_SNAPSHOT: DialogSnapshot | None = None
+DIALOG_SNAPSHOT_LOCK = asyncio.Lock()
+
+
+async def get_admin_status(peers: list[raw.base.InputPeer]) -> dict[int, bool]:
+    """
+    info:
+        Checks admin rights for channels and basic groups straight from the server,
+        with chunked GetChannels / GetChats calls running concurrently.
+        Duplicate peers are looked up once.
+    returns:
+        peer id -> is admin, peers that couldn't be checked are left out.
+    """
+    admin_status: dict[int, bool] = {}
+    channels: dict[int, raw.types.InputChannel] = {}
+    basic_groups: set[int] = set()
+
+    for peer in peers:
+        if isinstance(peer, raw.types.InputPeerChannel):
+            channels[peer.channel_id] = raw.types.InputChannel(channel_id=peer.channel_id, access_hash=peer.access_hash)
+        elif isinstance(peer, raw.types.InputPeerChat):
+            basic_groups.add(peer.chat_id)
+
+    requests = [
+        *(
+            raw.functions.channels.GetChannels(id=chunk)
+            for chunk in create_chunks(list(channels.values()), chunk_size=PRIVILEGE_CHUNK_SIZE)
+        ),
+        *(
+            raw.functions.messages.GetChats(id=chunk)
+            for chunk in create_chunks(list(basic_groups), chunk_size=PRIVILEGE_CHUNK_SIZE)
+        ),
+    ]
+    results = await asyncio.gather(*(bot.invoke(request) for request in requests), return_exceptions=True)
+
+    for result in results:
+        if isinstance(result, Exception):
+            LOGGER.error(f"Admin privilege lookup failed: {result}")
+            continue
+
+        for chat in result.chats:
+            admin_status[get_raw_peer_id(chat)] = is_chat_admin(chat)
+
+    return admin_status
+
+
+async def get_dialog_snapshot(refresh: bool = False) -> DialogSnapshot:
+    global DIALOG_SNAPSHOT
+
+    async with DIALOG_SNAPSHOT_LOCK:
+        if refresh or DIALOG_SNAPSHOT is None or DIALOG_SNAPSHOT.expired:
+            DIALOG_SNAPSHOT = await build_dialog_snapshot()
+
+    return DIALOG_SNAPSHOT
+
+
+async def build_dialog_snapshot() -> DialogSnapshot:
+    snapshot = DialogSnapshot()
 
     offset_date = 0
     offset_id = 0
@@ -64,7 +172,7 @@ async def get_dialogs():
                 offset_date=offset_date,
                 offset_id=offset_id,
                 offset_peer=offset_peer,
-                limit=request_limit,
+                limit=100,
                 hash=0,
                 exclude_pinned=False,
                 folder_id=0,
@@ -75,6 +183,10 @@ async def get_dialogs():
         users = {i.id: i for i in r.users}
         chats = {i.id: i for i in r.chats}
 
+        for peer in (*r.users, *r.chats):
+            if input_peer := get_input_peer(peer):
+                snapshot.input_peers[get_raw_peer_id(peer)] = input_peer
+
         messages = {}
 
         for message in r.messages:
@@ -83,7 +195,7 @@ async def get_dialogs():
             chat_id = utils.get_peer_id(message.peer_id)
             messages[chat_id] = message
 
-        dialogs = []
+        last_dialog = None
 
         for dialog in r.dialogs:
             if not isinstance(dialog, raw.types.Dialog):
@@ -91,36 +203,28 @@ async def get_dialogs():
 
             parsed = types.Dialog._parse(bot, dialog, messages, users, chats)
 
-            if parsed is None:
-                continue
-
-            if parsed.chat is None:
-                continue
-
-            if parsed.chat.id in seen_dialog_ids:
+            if parsed is None or parsed.chat is None or parsed.chat.id in seen_dialog_ids:
                 continue
 
             seen_dialog_ids.add(parsed.chat.id)
-            dialogs.append(parsed)
+            snapshot.dialogs.append(parsed)
+            last_dialog = dialog
 
-        if not dialogs:
-            return
+        # A plain Dialogs response (not a slice) already holds everything.
+        if last_dialog is None or isinstance(r, raw.types.messages.Dialogs):
+            break
 
-        last = dialogs[-1]
+        last_peer_id = utils.get_peer_id(last_dialog.peer)
+        last_message = messages.get(last_peer_id)
 
-        if last.top_message is None:
-            return
+        if last_message is None or last_peer_id not in snapshot.input_peers:
+            break
 
-        offset_id = last.top_message.id
-        offset_date = last.top_message.date
-        offset_peer = await bot.resolve_peer(last.chat.id)
+        offset_id = last_message.id
+        offset_date = last_message.date
+        offset_peer = snapshot.input_peers[last_peer_id]
 
-        for dialog in dialogs:
-            await sleep(0)
-            yield dialog
-            current += 1
-            if current >= total:
-                return
+    return snapshot
 
 
 def create_link(d: types.Dialog) -> str:
@@ -142,9 +246,11 @@ async def create_admin_folder(bot: BOT, message: Message):
     INFO: Creates a folder containing admin chats/channels
     FLAGS:
         -y: Automatically confirm adding chat to folder.
+        -c: reuse the dialog scan of the last few minutes instead of re-scanning.
     USAGE:
         .caf
         .caf -y
+        .caf -c
     """
     resp = await message.reply("`Initiating...`")
     cleanup_ids: set[int] = {resp.id}
@@ -162,13 +268,14 @@ async def create_admin_folder(bot: BOT, message: Message):
     else:
         folder_id = folder
 
-    existing_hashes = {x.access_hash for x in [*included_peers, *excluded_peers, *pinned_peers]}
+    existing_ids = {get_input_peer_id(x) for x in [*included_peers, *excluded_peers, *pinned_peers]}
 
     await resp.edit("`Fetching Admin Chats and Channels...`")
+    snapshot = await get_dialog_snapshot(refresh="-c" not in message.flags)
     new = 0
     async with bot.Convo(chat_id=message.chat.id, client=bot, from_user=message.from_user.id) as convo:
-        async for d in get_dialogs():
-            if not d.chat.admin_privileges or d.chat._raw.access_hash in existing_hashes:
+        for d in snapshot.dialogs:
+            if not d.chat.admin_privileges or d.chat.id in existing_ids or d.chat.id not in snapshot.input_peers:
                 continue
 
             if "-y" not in message.flags:
@@ -187,7 +294,7 @@ async def create_admin_folder(bot: BOT, message: Message):
                     await sleep(2)
                     continue
 
-            included_peers.append(await bot.resolve_peer(d.chat.id))
+            included_peers.append(snapshot.input_peers[d.chat.id])
             new += 1
 
     success = await update_folder(folder_id, included_peers, excluded_peers, pinned_peers)
@@ -213,12 +320,13 @@ async def refresh_admin_folder(bot: BOT, message: Message):
 
     resp = await message.reply("`Cleaning Non-Admin Chats and Channels in admin folder...`")
 
-    chats = await bot.invoke(raw.functions.channels.GetChannels(id=folder.include_peers))
-    to_delete_hash = [chat.access_hash for chat in chats.chats if not chat.admin_rights]
+    admin_status = await get_admin_status(folder.include_peers)
+
+    to_delete_ids = {peer_id for peer_id, is_admin in admin_status.items() if not is_admin}
 
-    folder.include_peers = list(filter(lambda x: x.access_hash not in to_delete_hash, folder.include_peers))
+    folder.include_peers = [peer for peer in folder.include_peers if get_input_peer_id(peer) not in to_delete_ids]
 
     success = await update_folder(folder_id=folder.id, folder=folder)
-    resp_text = f"Admin folder updated: {success}\nDeleted: {len(to_delete_hash)}"
+    resp_text = f"Admin folder updated: {success}\nDeleted: {len(to_delete_ids)}"
     await resp.edit(resp_text)
     await bot.log_text(text=resp_text, type="info")
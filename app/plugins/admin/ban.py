@@ -1,6 +1,7 @@
 from pyrogram.types import User
 
 from app import BOT, Message
+from app.plugins.admin.action_executor import FloodNotice, run_admin_action
 
 
 @BOT.add_cmd(cmd=["ban", "unban", "unmute"])
@@ -22,8 +23,12 @@ async def ban_or_unban(bot: BOT, message: Message) -> None:
     else:
         action_str = f"{message.cmd.capitalize()}ned"
 
+    flood_notice = FloodNotice(message)
+
     try:
-        await action(chat_id=message.chat.id, user_id=user.id)  # NOQA
+        await run_admin_action(lambda: action(chat_id=message.chat.id, user_id=user.id), on_flood=flood_notice)  # NOQA
         await message.reply(text=f"{action_str}: {user.mention}\nReason: {reason}")
     except Exception as e:
         await message.reply(text=e, del_in=10)
+    finally:
+        await flood_notice.delete()
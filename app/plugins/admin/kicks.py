@@ -5,6 +5,8 @@ from pyrogram.types import User
 
 from app import BOT, Message
 from app.extra_config import ADMIN_STATUS
+from app.plugins.admin.action_executor import FloodNotice, run_admin_action
+from app.plugins.admin.activity import get_activity_counts
 
 
 @BOT.add_cmd(cmd="kick")
@@ -18,13 +20,21 @@ async def kick_user(bot: BOT, message: Message):
         await message.reply(user, del_in=10)
         return
 
+    flood_notice = FloodNotice(message)
+
     try:
-        await bot.ban_chat_member(chat_id=message.chat.id, user_id=user.id)
+        await run_admin_action(
+            lambda: bot.ban_chat_member(chat_id=message.chat.id, user_id=user.id), on_flood=flood_notice
+        )
         await asyncio.sleep(2)
-        await bot.unban_chat_member(chat_id=message.chat.id, user_id=user.id)
+        await run_admin_action(
+            lambda: bot.unban_chat_member(chat_id=message.chat.id, user_id=user.id), on_flood=flood_notice
+        )
         await message.reply(text=f"{message.cmd.capitalize()}ed: {user.mention}\nReason: {reason}")
     except Exception as e:
         await message.reply(text=e, del_in=10)
+    finally:
+        await flood_notice.delete()
 
 
 @BOT.add_cmd(cmd="kick_im", allow_sudo=False)
@@ -32,6 +42,10 @@ async def kick_inactive_members(bot: BOT, message: Message):
     """
     CMD: KICK_IM
     INFO: Kick inactive members with message count less than 10
+    FLAGS: -r: re-build the chat's activity index from scratch.
+    USAGE:
+        .kick_im
+        .kick_im -r
     """
 
     if not (message.chat.admin_privileges and message.chat.admin_privileges.can_restrict_members):
@@ -41,6 +55,12 @@ async def kick_inactive_members(bot: BOT, message: Message):
     count = 0
     chat_id = message.chat.id
 
+    response = await message.reply("Indexing chat activity...")
+    activity_counts = await get_activity_counts(chat_id, response=response, rebuild="-r" in message.flags)
+    await response.delete()
+
+    flood_notice = FloodNotice(message)
+
     async with bot.Convo(client=bot, chat_id=chat_id, from_user=message.from_user.id) as convo:
         async for member in bot.get_chat_members(chat_id):
             if member.status in ADMIN_STATUS:
@@ -48,7 +68,7 @@ async def kick_inactive_members(bot: BOT, message: Message):
 
             user = member.user
 
-            message_count = await bot.search_messages_count(chat_id=chat_id, from_user=user.id)
+            message_count = activity_counts[user.id]
             if message_count >= 10:
                 continue
 
@@ -63,10 +83,13 @@ async def kick_inactive_members(bot: BOT, message: Message):
                 text, _ = await convo.get_quote_or_text(lower=True)
 
                 if text == "y":
-                    await bot.ban_chat_member(
-                        chat_id=chat_id,
-                        user_id=user.id,
-                        until_date=datetime.now(UTC) + timedelta(seconds=60),
+                    await run_admin_action(
+                        lambda: bot.ban_chat_member(
+                            chat_id=chat_id,
+                            user_id=user.id,
+                            until_date=datetime.now(UTC) + timedelta(seconds=60),
+                        ),
+                        on_flood=flood_notice,
                     )
                     await prompt.edit(f"Kicked {user.mention}")
                     count += 1
@@ -77,4 +100,5 @@ async def kick_inactive_members(bot: BOT, message: Message):
             except TimeoutError:
                 pass
 
+    await flood_notice.delete()
     await message.reply(f"Kicked {count} inactive members.")
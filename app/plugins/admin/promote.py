@@ -1,10 +1,10 @@
 import asyncio
 
-from pyrogram.enums import ChatMembersFilter
-from pyrogram.errors import FloodWait
+from pyrogram.enums import ChatMembersFilter, ChatMemberStatus
 from pyrogram.types import ChatPrivileges, User
 
 from app import BOT, Message
+from app.plugins.admin.action_executor import run_admin_actions
 
 DEMOTE_PRIVILEGES = ChatPrivileges(can_manage_chat=False)
 
@@ -76,24 +76,17 @@ async def demote_all(bot: BOT, message: Message):
         return
 
     resp = await message.reply("Hang on demoting all Admins...")
-    count = 0
-
-    async for member in bot.get_chat_members(chat_id=message.chat.id, filter=ChatMembersFilter.ADMINISTRATORS):
-        try:
-            await bot.promote_chat_member(
-                chat_id=message.chat.id,
-                user_id=member.user.id,
-                privileges=DEMOTE_PRIVILEGES,
-            )
-        except FloodWait as f:
-            await asyncio.sleep(f.value + 10)
-            await bot.promote_chat_member(
-                chat_id=message.chat.id,
-                user_id=member.user.id,
-                privileges=DEMOTE_PRIVILEGES,
-            )
-        await asyncio.sleep(0.5)
-        count += 1
-
-    await resp.edit(f"Demoted <b>{count}</b> admins in {message.chat.title}.")
+
+    admin_ids = [
+        member.user.id
+        async for member in bot.get_chat_members(chat_id=message.chat.id, filter=ChatMembersFilter.ADMINISTRATORS)
+        if member.status != ChatMemberStatus.OWNER
+    ]
+
+    async def demote(user_id: int):
+        await bot.promote_chat_member(chat_id=message.chat.id, user_id=user_id, privileges=DEMOTE_PRIVILEGES)
+
+    summary = await run_admin_actions(admin_ids, demote, response=resp, progress_text="Demoted")
+
+    await resp.edit(f"{summary.format('Demoted', 'admins')}\nChat: {message.chat.title}")
     await resp.log()
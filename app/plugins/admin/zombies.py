@@ -1,10 +1,9 @@
-import asyncio
+import time
 from datetime import UTC, datetime, timedelta
 
-from pyrogram.errors import FloodWait
-
 from app import BOT, Message
 from app.extra_config import ADMIN_STATUS
+from app.plugins.admin.action_executor import PROGRESS_INTERVAL, edit_progress, run_admin_actions
 
 
 @BOT.add_cmd(cmd="zombies")
@@ -12,38 +11,60 @@ async def clean_zombies(bot: BOT, message: Message):
     """
     CMD: ZOMBIES
     INFO: Cleans deleted accounts from chat.
+    FLAGS: -d: dry run, only count zombies.
+    USAGE:
+        .zombies
+        .zombies -d
     """
-    if not (message.chat.admin_privileges and message.chat.admin_privileges.can_restrict_members):
+    dry_run = "-d" in message.flags
+
+    if not dry_run and not (message.chat.admin_privileges and message.chat.admin_privileges.can_restrict_members):
         await message.reply("Cannot clean zombies without being admin / Not enough rights.")
         return
 
-    zombies = 0
-    admin_zombies = 0
-
-    response = await message.reply("Cleaning Zombies....\nthis may take a while")
-
-    async for member in bot.get_chat_members(chat_id=message.chat.id):
-        try:
-            if member.user.is_deleted:
-                if member.status in ADMIN_STATUS:
-                    admin_zombies += 1
-                    continue
+    response = await message.reply("Scanning members for Zombies....\nthis may take a while")
 
-                zombies += 1
+    zombie_ids, admin_zombies = await scan_zombies(bot, message.chat.id, response)
 
-                await bot.ban_chat_member(
-                    chat_id=message.chat.id,
-                    user_id=member.user.id,
-                    until_date=datetime.now(UTC) + timedelta(seconds=60),
-                )
-                await asyncio.sleep(1)
+    if dry_run:
+        resp_str = f"Found <b>{len(zombie_ids)}</b> zombies."
+    else:
+        await response.edit(f"Cleaning <b>{len(zombie_ids)}</b> zombies....")
 
-        except FloodWait as e:
-            await asyncio.sleep(e.value + 3)
+        async def ban(user_id: int):
+            await bot.ban_chat_member(
+                chat_id=message.chat.id, user_id=user_id, until_date=datetime.now(UTC) + timedelta(seconds=60)
+            )
 
-    resp_str = f"Cleaned <b>{zombies}</b> zombies."
+        summary = await run_admin_actions(zombie_ids, ban, response=response, progress_text="Cleaned zombies")
+        resp_str = summary.format("Cleaned", "zombies")
 
     if admin_zombies:
         resp_str += f"\n<b>{admin_zombies}</b> Admin Zombie(s) not Removed."
 
     await response.edit(resp_str)
+
+
+async def scan_zombies(bot: BOT, chat_id: int, response: Message) -> tuple[list[int], int]:
+    """Collects deleted accounts in one pass over the member list, editing progress every PROGRESS_INTERVAL secs."""
+    zombie_ids = []
+    admin_zombies = 0
+    scanned = 0
+    next_progress_at = time.monotonic() + PROGRESS_INTERVAL
+
+    async for member in bot.get_chat_members(chat_id=chat_id):
+        scanned += 1
+
+        if member.user and member.user.is_deleted:
+            if member.status in ADMIN_STATUS:
+                admin_zombies += 1
+            else:
+                zombie_ids.append(member.user.id)
+
+        if time.monotonic() >= next_progress_at:
+            next_progress_at = time.monotonic() + PROGRESS_INTERVAL
+            await edit_progress(
+                response, f"Scanned <b>{scanned}</b> members, found <b>{len(zombie_ids)}</b> zombies..."
+            )
+
+    return zombie_ids, admin_zombies
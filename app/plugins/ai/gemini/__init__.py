@@ -1,5 +1,6 @@
 from .client import client, async_client
 from .configs import AIConfig, get_model_config, declare_in_tools
 from .models import Models, MODEL_FLAG_MAP, get_models_list
-from .response import Response, send_message_with_retry_delay_guard, get_retry_delay, export_history
+from .response import Response, send_message_with_retry_delay_guard, get_retry_delay
 from .utils import create_prompts, upload_file, upload_tg_file, run_basic_check, PROMPT_MAP
+from .history import export_history, iter_history, is_history_file, HISTORY_FILE_NAME
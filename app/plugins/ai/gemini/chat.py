@@ -1,13 +1,40 @@
-import pickle
+import asyncio
+import time
 
+from google.genai import types
 from google.genai.chats import AsyncChat
 from pyrogram.enums import ChatType, ParseMode
-from ub_core import BOT, Convo, Message, bot
-
-from app.plugins.ai.gemini import Response, async_client, export_history, get_model_config
+from ub_core import BOT, LOGGER, Convo, CustomDB, Message, bot
+
+from app.plugins.ai.gemini import (
+    HISTORY_FILE_NAME,
+    Response,
+    async_client,
+    export_history,
+    get_model_config,
+    is_history_file,
+    iter_history,
+)
 from app.plugins.ai.gemini.code import create_plugin
+from app.plugins.ai.gemini.history import compact_history, drop_expired_files, strip_inline_media, window_history
+from app.plugins.ai.gemini.rate_limit import RATE_LIMITER
+from app.plugins.ai.gemini.response import (
+    estimate_tokens,
+    is_text_only,
+    is_voice_file,
+    stream_response,
+    wrap_in_quote,
+)
 from app.plugins.ai.gemini.utils import create_prompts, run_basic_check
 
+CONVO_DB = CustomDB["AI_CONVERSATIONS"]
+
+MAX_STORED_TURNS = 20
+
+# Once the turns outside the kept window grow past this, they are folded into a summary.
+HISTORY_TOKEN_BUDGET = 32000
+COMPACTION_KEEP_TURNS = 4
+
 
 @bot.add_cmd(cmd="aic")
 @run_basic_check
@@ -20,15 +47,17 @@ async def ai_chat(bot: BOT, message: Message):
         -i: use image gen/edit mode
         -a: audio output
         -sp: multi speaker output
+        -n: start a new conversation instead of resuming the saved one
     USAGE:
         .aic hello
         keep replying to AI responses with text | media [no need to reply in DM]
         After 5 minutes of Idle bot will export history and stop chat.
-        use .load_history to continue
+        The conversation is saved and the next .aic resumes it automatically, even after a restart.
+        use .aic -n to start over or .load_history to continue an exported one
 
     """
-    chat = async_client.chats.create(**get_model_config(message.flags))
-    await do_convo(chat=chat, message=message)
+    history = None if "-n" in message.flags else await load_conversation(message.unique_chat_user_id)
+    await do_convo(message=message, model_config=get_model_config(message.flags), history=history)
 
 
 @bot.add_cmd(cmd="lh")
@@ -45,11 +74,9 @@ async def history_chat(bot: BOT, message: Message):
     if not message.input:
         await message.reply(f"Ask a question along with {message.trigger}{message.cmd}")
         return
-    expected_name = "AI_Chat_History.pkl"
-
     try:
         file_name = reply.document.file_name
-        assert file_name == expected_name or file_name.endswith("chat_history.pkl")
+        assert is_history_file(file_name)
     except (AssertionError, AttributeError):
         await message.reply("Reply to a Valid History file.")
         return
@@ -58,13 +85,17 @@ async def history_chat(bot: BOT, message: Message):
 
     doc = await reply.download(in_memory=True)
     doc.seek(0)
-    history = pickle.load(doc)
+
+    try:
+        history = await drop_expired_files(list(iter_history(doc)))
+    except Exception as e:
+        await resp.edit(f"Invalid History file: {e}")
+        return
 
     await resp.edit("__History Loaded... Resuming chat__")
 
-    if file_name == expected_name:
-        chat = async_client.chats.create(**get_model_config(message.flags), history=history)
-        await do_convo(chat=chat, message=message)
+    if file_name.startswith(HISTORY_FILE_NAME):
+        await do_convo(message=message, model_config=get_model_config(message.flags), history=history)
     else:
         await create_plugin(bot, message, history)
 
@@ -72,7 +103,9 @@ async def history_chat(bot: BOT, message: Message):
 CONVO_CACHE: dict[str, Convo] = {}
 
 
-async def do_convo(chat: AsyncChat, message: Message):
+async def do_convo(message: Message, model_config: dict, history: list[types.Content] | None = None):
+    chat = async_client.chats.create(**model_config, history=history)
+    stream = is_text_only(model_config["config"])
     chat_id = message.chat.id
 
     old_conversation = CONVO_CACHE.get(message.unique_chat_user_id)
@@ -96,32 +129,103 @@ async def do_convo(chat: AsyncChat, message: Message):
 
     CONVO_CACHE[message.unique_chat_user_id] = conversation_object
 
+    # Context size after each turn, turn_tokens[-k - 1] is what the turns before the last k cost.
+    turn_tokens: list[int] = []
+    compaction: asyncio.Task | None = None
+
     try:
         async with conversation_object:
-            prompt = await create_prompts(message)
+            try:
+                prompt = await create_prompts(message)
+            except AssertionError as e:
+                await message.reply(str(e))
+                return
+
             reply_to_id = message.id
 
             while True:
-                ai_response = await chat.send_message(prompt)
-                prompt_message = await send_and_get_resp(
-                    convo_obj=conversation_object, response=ai_response, reply_to_id=reply_to_id
-                )
+                estimated_tokens = estimate_tokens([*chat.get_history(curated=True), *prompt])
+                await RATE_LIMITER.acquire(model_config["model"], estimated_tokens)
+
+                if stream:
+                    response = await stream_resp(
+                        convo_obj=conversation_object,
+                        stream=await chat.send_message_stream(prompt),
+                        reply_to_id=reply_to_id,
+                    )
+                else:
+                    ai_response = await chat.send_message(prompt)
+                    response = await send_resp(
+                        convo_obj=conversation_object, response=ai_response, reply_to_id=reply_to_id
+                    )
+
+                RATE_LIMITER.record(model_config["model"], response.total_tokens, estimated_tokens)
+                await save_conversation(message.unique_chat_user_id, chat)
+
+                turn_tokens.append(response.total_tokens)
+                if len(turn_tokens) > COMPACTION_KEEP_TURNS and (
+                    turn_tokens[-COMPACTION_KEEP_TURNS - 1] > HISTORY_TOKEN_BUDGET
+                ):
+                    # Summarize while the user is typing, so the wait is usually hidden.
+                    compaction = asyncio.create_task(compact_chat(chat, model_config))
+                    turn_tokens.clear()
+
+                prompt_message = await conversation_object.get_response()
+
+                if compaction:
+                    chat = await compaction
+                    compaction = None
 
                 try:
                     prompt = await create_prompts(prompt_message, is_chat=True, check_size=False)
                 except Exception as e:
-                    prompt_message = await send_and_get_resp(conversation_object, str(e), reply_to_id=reply_to_id)
+                    await conversation_object.send_message(text=str(e), reply_to_id=prompt_message.id)
+                    prompt_message = await conversation_object.get_response()
                     prompt = await create_prompts(prompt_message, is_chat=True, check_size=False)
 
                 reply_to_id = prompt_message.id
 
     except TimeoutError:
-        await export_history(chat, message)
+        await export_history(chat, message, model=model_config["model"])
     finally:
+        if compaction:
+            compaction.cancel()
         CONVO_CACHE.pop(message.unique_chat_user_id, 0)
 
 
-async def send_and_get_resp(convo_obj: Convo, response, reply_to_id: int | None = None) -> Message:
+async def compact_chat(chat: AsyncChat, model_config: dict) -> AsyncChat:
+    try:
+        history = await compact_history(chat.get_history(curated=True), COMPACTION_KEEP_TURNS)
+    except Exception as e:
+        LOGGER.error(f"AI chat history compaction failed: {e}")
+        return chat
+
+    return async_client.chats.create(**model_config, history=history)
+
+
+async def save_conversation(unique_id: str, chat: AsyncChat):
+    """Persists a window of the conversation so it can be resumed after idle timeout or restart."""
+    history = window_history(chat.get_history(curated=True), MAX_STORED_TURNS)
+    await CONVO_DB.add_data(
+        {
+            "_id": unique_id,
+            "history": [strip_inline_media(content).model_dump_json(exclude_none=True) for content in history],
+            "updated_at": time.time(),
+        }
+    )
+
+
+async def load_conversation(unique_id: str) -> list[types.Content] | None:
+    saved_conversation = await CONVO_DB.find_one({"_id": unique_id})
+
+    if not saved_conversation:
+        return None
+
+    history = [types.Content.model_validate_json(content) for content in saved_conversation["history"]]
+    return await drop_expired_files(history)
+
+
+async def send_resp(convo_obj: Convo, response, reply_to_id: int | None = None) -> Response:
     response = Response(response)
 
     if text := response.quoted_text():
@@ -133,11 +237,42 @@ async def send_and_get_resp(convo_obj: Convo, response, reply_to_id: int | None
         await convo_obj.send_photo(photo=response.image_file, reply_to_id=reply_to_id)
 
     if response.audio:
-        await convo_obj.send_voice(
-            voice=response.audio_file,
-            waveform=response.audio_file.waveform,
-            reply_to_id=reply_to_id,
-            duration=response.audio_file.duration,
+        voice_file = await response.get_voice_file()
+        if is_voice_file(voice_file):
+            await convo_obj.send_voice(
+                voice=voice_file,
+                waveform=voice_file.waveform,
+                reply_to_id=reply_to_id,
+                duration=voice_file.duration,
+            )
+        else:
+            await convo_obj.send_audio(audio=voice_file, reply_to_id=reply_to_id, duration=voice_file.duration)
+
+    return response
+
+
+async def stream_resp(convo_obj: Convo, stream, reply_to_id: int | None = None) -> Response:
+    reply: Message | None = None
+
+    async def edit_streamed(text: str):
+        nonlocal reply
+        text = f"**>•><**\n{wrap_in_quote(text)}"
+
+        if reply is None:
+            reply = await convo_obj.send_message(
+                text=text, reply_to_id=reply_to_id, parse_mode=ParseMode.MARKDOWN, disable_preview=True
+            )
+        else:
+            await reply.edit(text=text, parse_mode=ParseMode.MARKDOWN, disable_preview=True)
+
+    response = await stream_response(stream, edit_streamed)
+    text = f"**>•><**\n{response.quoted_text()}"
+
+    if reply is None:
+        await convo_obj.send_message(
+            text=text, reply_to_id=reply_to_id, parse_mode=ParseMode.MARKDOWN, disable_preview=True
         )
+    else:
+        await reply.edit(text=text, parse_mode=ParseMode.MARKDOWN, disable_preview=True)
 
-    return await convo_obj.get_response()
+    return response
@@ -1,8 +1,15 @@
 import asyncio
+import hashlib
 import io
+import json
+import os
 import pathlib
+import tempfile
+from datetime import UTC, datetime
+from functools import lru_cache
 
 import pyrogram
+from google.genai import types
 from google.genai.types import File, Part
 from ub_core import BOT, LOGGER, Message, ub_core_dirname
 from ub_core.utils import MediaExtensions, bytes_to_mb
@@ -17,6 +24,7 @@ from app.plugins.ai.gemini import (
     send_message_with_retry_delay_guard,
     utils,
 )
+from app.plugins.ai.gemini.symbols import SymbolIndex
 
 PYRO_PATH = pathlib.Path(pyrogram.__file__).parent.resolve()
 
@@ -28,6 +36,26 @@ if extra_config.INDEX_EXTRA_MODULES:
 
 CODEBASE_INDEX_FILE = None
 
+CACHE_DIR = pathlib.Path(".cache/gemini").resolve()
+CODEBASE_PARTS_DIR = CACHE_DIR / "codebase_parts"
+CODEBASE_BLOB = CACHE_DIR / "codebase_index.txt"
+CODEBASE_MANIFEST = CACHE_DIR / "codebase_manifest.json"
+PYRO_MIRROR = CACHE_DIR / f"pyrogram_{pyrogram.__version__}"
+# Written last by build_pyro_mirror, a mirror without it may hold files truncated by a crash.
+PYRO_MIRROR_MARKER = PYRO_MIRROR / ".complete"
+
+CODEBASE_CACHE_TTL = "3600s"
+
+# Guards the manifest, blob and part files on disk, the blob upload and the cached content records.
+CODEBASE_LOCK = asyncio.Lock()
+
+SYMBOL_INDEX: SymbolIndex | None = None
+
+
+async def init_task():
+    asyncio.create_task(refresh_symbol_index(), name="gemini_symbol_index")
+    asyncio.create_task(asyncio.to_thread(build_pyro_mirror), name="gemini_pyro_mirror")
+
 
 def replace_indents(line: str, char: str = "@") -> str:
     de_indented_line = line.lstrip(" ")
@@ -84,7 +112,7 @@ def get_pyro_file_contents(file_paths: list[str]) -> str:
 
     for file in file_paths:
         if file.is_relative_to(PYRO_PATH):
-            contents.append(shrink_file(file, comments=True, de_indent=True))
+            contents.append(get_shrunk_pyro_file(file, file.stat().st_mtime_ns))
         else:
             contents.append(f"Error: path {file} is not relative to {PYRO_PATH}: Access denied.")
         contents.append(f"\n ### {file.name} ### \n")
@@ -92,66 +120,317 @@ def get_pyro_file_contents(file_paths: list[str]) -> str:
     return "".join(contents)
 
 
-async def upload_codebase(refresh: bool = False) -> File:
+@lru_cache(maxsize=256)
+def get_shrunk_pyro_file(file: pathlib.Path, mtime_ns: int) -> str:
+    """mtime_ns is part of the cache key so edited files are never served stale."""
+    mirror_file = PYRO_MIRROR / file.relative_to(PYRO_PATH)
+
+    if PYRO_MIRROR_MARKER.is_file() and mirror_file.is_file() and mirror_file.stat().st_mtime_ns >= mtime_ns:
+        return mirror_file.read_text(encoding="utf-8")
+
+    return write_to_mirror(file, mirror_file)
+
+
+def write_to_mirror(file: pathlib.Path, mirror_file: pathlib.Path) -> str:
+    """The background build and tool calls write the same files, readers only ever see a whole file."""
+    shrunk = shrink_file(file, comments=True, de_indent=True)
+    mirror_file.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=mirror_file.parent, prefix=f".{mirror_file.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as temp_file:
+            temp_file.write(shrunk)
+        os.replace(temp_path, mirror_file)
+    except BaseException:
+        pathlib.Path(temp_path).unlink(missing_ok=True)
+        raise
+
+    return shrunk
+
+
+def build_pyro_mirror():
+    """
+    Pre-shrinks the whole pyrogram tree once per pyrogram version.
+    Without the marker nothing already in the mirror is trusted, every file is re-written.
+    """
+    if PYRO_MIRROR_MARKER.is_file():
+        return
+
+    for file in PYRO_PATH.rglob("*.py"):
+        write_to_mirror(file, PYRO_MIRROR / file.relative_to(PYRO_PATH))
+
+    PYRO_MIRROR_MARKER.touch()
+    LOGGER.info(f"Pyrogram shrunk mirror built at {PYRO_MIRROR}")
+
+
+@declare_in_tools(tools_list=[AIConfig.CODE_CONFIG.tools])
+def search_codebase_symbols(query: str, limit: int = 10) -> str:
+    """
+    Searches classes, functions and methods of ub-core, plain-ub and pyrogram by keywords.
+    Returns file path, line, signature and docstring of the best matches,
+    plus the source of short ub-core/plain-ub functions as style reference.
+
+    params:
+        query: keywords describing the functionality needed, e.g. "send document reply" or "Convo get_response".
+        limit: max number of symbols to return.
+    """
+    index = SYMBOL_INDEX or build_symbol_index()
+    results = index.search(query, limit=min(limit, 25))
+
+    if not results:
+        return f"No symbols found for: {query}"
+
+    return "\n\n".join(symbol.format() for symbol in results)
+
+
+def build_symbol_index() -> SymbolIndex:
+    global SYMBOL_INDEX
+
+    index = SymbolIndex()
+    index.build((file for file in iter_codebase_files() if file.suffix == ".py"), with_source=True)
+    # raw TL objects all define read/write for serialization, they only add noise.
+    index.build(sorted(PYRO_PATH.rglob("*.py")), exclude_names=frozenset({"read", "write"}))
+
+    SYMBOL_INDEX = index
+    return index
+
+
+async def refresh_symbol_index():
+    index = await asyncio.to_thread(build_symbol_index)
+    LOGGER.info(f"Gemini symbol index built: [{len(index.symbols)} symbols]")
+
+
+def get_codebase_tree() -> str:
+    return "\n".join(str(file) for file in iter_codebase_files())
+
+
+def load_manifest() -> dict:
+    try:
+        return json.loads(CODEBASE_MANIFEST.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(manifest: dict):
+    CODEBASE_MANIFEST.write_text(json.dumps(manifest))
+
+
+def iter_codebase_files():
+    for root in CODEBASE_PATHS:
+        for file in sorted(root.rglob("*")):
+            file = file.resolve()
+
+            if not file.is_file() or file.is_relative_to(CACHE_DIR):
+                continue
+
+            if not extra_config.INDEX_EXTRA_MODULES and file.is_relative_to(EXTRA_MODULES):
+                continue
+
+            if file.suffix in MediaExtensions.CODE:
+                yield file
+
+
+def build_codebase_index() -> str:
+    """
+    info:
+        Incrementally rebuilds the codebase index blob on disk.
+        Only files whose mtime/size changed are re-read, hashed and re-shrunk,
+        and the blob is re-assembled only if the combined hash changed.
+    returns:
+        combined hash of the indexed codebase
+    """
+    CODEBASE_PARTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    manifest = load_manifest()
+    old_files: dict[str, dict] = manifest.get("files", {})
+    new_files: dict[str, dict] = {}
+
+    combined_hash = hashlib.sha256()
+
+    for file in iter_codebase_files():
+        stat = file.stat()
+        entry = old_files.get(str(file))
+
+        if not (entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size):
+            entry = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "hash": hashlib.sha256(file.read_bytes()).hexdigest(),
+            }
+
+        part_file = CODEBASE_PARTS_DIR / f"{entry['hash']}.txt"
+
+        if not part_file.is_file():
+            try:
+                part_file.write_text(shrink_file(file), encoding="utf-8")
+            except Exception as e:
+                part_file.write_text(str(e), encoding="utf-8")
+
+        new_files[str(file)] = entry
+        combined_hash.update(f"{file}:{entry['hash']}\n".encode())
+
+    pyro_tree = f"\n\n\nPyrogram file path tree:\n{sorted(PYRO_PATH.rglob('*py'))}"
+    combined_hash.update(pyro_tree.encode())
+    combined_hash = combined_hash.hexdigest()
+
+    if combined_hash != manifest.get("combined_hash") or not CODEBASE_BLOB.is_file():
+        codebase_parts = []
+
+        for file, entry in new_files.items():
+            codebase_parts.append((CODEBASE_PARTS_DIR / f"{entry['hash']}.txt").read_text(encoding="utf-8"))
+            codebase_parts.append(f"\n##### {file} #####\n")
+
+        codebase_parts.append(pyro_tree)
+        CODEBASE_BLOB.write_text("".join(codebase_parts), encoding="utf-8")
+
+        live_parts = {f"{entry['hash']}.txt" for entry in new_files.values()}
+        for part_file in CODEBASE_PARTS_DIR.iterdir():
+            if part_file.name not in live_parts:
+                part_file.unlink(missing_ok=True)
+
+    manifest["files"] = new_files
+    manifest["combined_hash"] = combined_hash
+    save_manifest(manifest)
+
+    return combined_hash
+
+
+async def upload_codebase(refresh: bool = False, force: bool = False) -> File:
     """
     info:
         Upload project context to file storage
     args:
-        refresh: set to True to force re-upload of context.
+        refresh: set to True to re-scan the codebase for changes.
+        force: set to True to re-upload even if the codebase hash didn't change.
     returns:
         uploaded file
     """
+    async with CODEBASE_LOCK:
+        return await _upload_codebase(refresh=refresh, force=force)
+
+
+async def _upload_codebase(refresh: bool = False, force: bool = False) -> File:
     global CODEBASE_INDEX_FILE
 
-    if CODEBASE_INDEX_FILE and not refresh:
+    if CODEBASE_INDEX_FILE and not (refresh or force):
         try:
             await async_client.files.get(name=CODEBASE_INDEX_FILE.name)
             return CODEBASE_INDEX_FILE
         except Exception as e:
             LOGGER.error(f"Error accessing uploaded codebase file: {e}\nAuto Refreshing...")
 
-    codebase_parts = []
+    combined_hash = await asyncio.to_thread(build_codebase_index)
 
-    for root in CODEBASE_PATHS:
-        for file in sorted(root.rglob("*")):
-            file = file.resolve()
+    manifest = load_manifest()
+    uploaded = manifest.get("uploaded") or {}
 
-            if not file.is_file():
-                continue
-
-            if not extra_config.INDEX_EXTRA_MODULES and file.is_relative_to(EXTRA_MODULES):
-                continue
-
-            if file.suffix in MediaExtensions.CODE:
-                try:
-                    codebase_parts.append(shrink_file(file))
-                except Exception as e:
-                    codebase_parts.append(str(e))
+    if (
+        not force
+        and uploaded.get("combined_hash") == combined_hash
+        and uploaded.get("expiration_time", 0) > datetime.now(UTC).timestamp()
+    ):
+        try:
+            CODEBASE_INDEX_FILE = await async_client.files.get(name=uploaded["name"])
+            return CODEBASE_INDEX_FILE
+        except Exception as e:
+            LOGGER.error(f"Error accessing uploaded codebase file: {e}\nRe-uploading...")
 
-                codebase_parts.append(f"\n##### {file} #####\n")
+    CODEBASE_INDEX_FILE = await utils.upload_file(CODEBASE_BLOB, CODEBASE_BLOB.name)
 
-    codebase_parts.append(f"\n\n\nPyrogram file path tree:\n{sorted(PYRO_PATH.rglob('*py'))}")
+    manifest["uploaded"] = {
+        "combined_hash": combined_hash,
+        "name": CODEBASE_INDEX_FILE.name,
+        "expiration_time": CODEBASE_INDEX_FILE.expiration_time.timestamp(),
+    }
+    await asyncio.to_thread(save_manifest, manifest)
 
-    joined_codebase = "".join(codebase_parts)
+    LOGGER.info(f"Codebase indexed successfully: [{bytes_to_mb(CODEBASE_BLOB.stat().st_size)} MBs] [{combined_hash}]")
+    return CODEBASE_INDEX_FILE
 
-    codebase = io.BytesIO(bytes(joined_codebase, encoding="utf-8"))
-    codebase.name = "codebase_index.txt"
 
-    CODEBASE_INDEX_FILE = await utils.upload_file(codebase, codebase.name)
+async def get_codebase_cache_config(
+    model: str, config: types.GenerateContentConfig
+) -> types.GenerateContentConfig | None:
+    """
+    info:
+        Creates or reuses a Gemini cached content holding the codebase index,
+        along with the config's system instruction and tools, which must live in the cache.
+        One cache is kept per model and config, re-created when the codebase hash changes
+        and its TTL is extended every time it's reused.
+    returns:
+        a copy of config pointing at the cached content, or None if caching failed.
+    """
+    try:
+        # Concurrent -wc calls would each create a cache and drop the other's record, leaking it till its TTL.
+        async with CODEBASE_LOCK:
+            context_file = await _upload_codebase()
+
+            manifest = load_manifest()
+            combined_hash = manifest["uploaded"]["combined_hash"]
+            caches: dict[str, dict] = manifest.setdefault("caches", {})
+
+            config_hash = hashlib.sha256(
+                config.model_dump_json(include={"system_instruction", "tools", "tool_config"}).encode()
+            ).hexdigest()[:16]
+            key = f"{model}:{config_hash}"
+            cache_info = caches.get(key)
+
+            cache = None
+            if cache_info and cache_info["combined_hash"] == combined_hash:
+                try:
+                    cache = await async_client.caches.update(
+                        name=cache_info["name"],
+                        config=types.UpdateCachedContentConfig(ttl=CODEBASE_CACHE_TTL),
+                    )
+                except Exception as e:
+                    LOGGER.error(f"Error extending codebase cache: {e}\nRe-creating...")
 
-    LOGGER.info(
-        f"Codebase indexed successfully: [{bytes_to_mb(len(codebase.getvalue()))} MBs] [{len(joined_codebase)} chars]"
+            elif cache_info:
+                try:
+                    await async_client.caches.delete(name=cache_info["name"])
+                except Exception:
+                    pass
+
+            if cache is None:
+                cache = await async_client.caches.create(
+                    model=model,
+                    config=types.CreateCachedContentConfig(
+                        display_name="codebase_index",
+                        contents=[
+                            types.Content(
+                                role="user",
+                                parts=[Part.from_uri(file_uri=context_file.uri, mime_type=context_file.mime_type)],
+                            )
+                        ],
+                        system_instruction=config.system_instruction,
+                        tools=config.tools or None,
+                        tool_config=config.tool_config,
+                        ttl=CODEBASE_CACHE_TTL,
+                    ),
+                )
+
+            caches[key] = {"combined_hash": combined_hash, "name": cache.name}
+            await asyncio.to_thread(save_manifest, manifest)
+
+    except Exception as e:
+        LOGGER.error(f"Codebase context caching failed, attaching file instead: {e}")
+        return None
+
+    # Requests using a cached content must not repeat what the cache already holds.
+    return config.model_copy(
+        update={"cached_content": cache.name, "system_instruction": None, "tools": None, "tool_config": None}
     )
-    return CODEBASE_INDEX_FILE
 
 
 @BOT.add_cmd("acr")
 async def refresh_codebase(bot: BOT, message: Message):
     """
     CMD: AI CODEBASE REFRESH
-    INFO: re-builds and re-uploads codebase
+    INFO: re-builds changed parts of the codebase index and re-uploads it if anything changed.
+    FLAGS: -f to force re-upload
+    USAGE: .acr | .acr -f
     """
-    await upload_codebase(refresh=True)
+    await asyncio.gather(upload_codebase(refresh=True, force="-f" in message.flags), refresh_symbol_index())
     await message.reply("Codebase refreshed...")
 
 
@@ -161,15 +440,26 @@ async def create_plugin(bot: BOT, message: Message, history=None):
     """
     CMD: AI CODE
     INFO: Generates code for the userbot based on existing codebase
-    USAGE: .aicode create a plugin ...
+    FLAGS: -wc to attach the whole codebase instead of letting AI search for relevant symbols.
+    USAGE: .acode create a plugin ... | .acode -wc create a plugin ...
     """
-    chat = async_client.chats.create(model=Models.CODE_MODEL, config=AIConfig.CODE_CONFIG, history=history)
+    config = AIConfig.CODE_CONFIG
     prompts = await utils.create_prompts(message, is_chat=True)
 
     if history is None:
         await message.reply("`Generating plugin...`")
-        context_file = await upload_codebase()
-        prompts.append(Part.from_uri(file_uri=context_file.uri, mime_type=context_file.mime_type))
+
+        if "-wc" in message.flags:
+            if cached_config := await get_codebase_cache_config(Models.CODE_MODEL, config):
+                config = cached_config
+            else:
+                context_file = await upload_codebase()
+                prompts.append(Part.from_uri(file_uri=context_file.uri, mime_type=context_file.mime_type))
+        else:
+            codebase_tree = await asyncio.to_thread(get_codebase_tree)
+            prompts.append(Part.from_text(text=f"Project file tree:\n{codebase_tree}"))
+
+    chat = async_client.chats.create(model=Models.CODE_MODEL, config=config, history=history)
 
     async with bot.Convo(
         chat_id=message.chat.id, client=bot, from_user=message.from_user.id, reply_to_user_id=bot.me.id, timeout=300
@@ -177,7 +467,9 @@ async def create_plugin(bot: BOT, message: Message, history=None):
         name = ai_response = None
         try:
             while True:
-                ai_response = await send_message_with_retry_delay_guard(chat, ai_response, prompts, tg_convo)
+                ai_response = await send_message_with_retry_delay_guard(
+                    chat, ai_response, prompts, tg_convo, model=Models.CODE_MODEL
+                )
 
                 if ai_response.text.startswith("ERROR:"):
                     await tg_convo.send_message(
@@ -214,7 +506,5 @@ async def create_plugin(bot: BOT, message: Message, history=None):
                 if user_response.text:
                     prompts.append(Part.from_text(text=str(user_response_text)))
 
-                await asyncio.sleep(15)
-
         finally:
-            await export_history(chat=chat, message=message, name=f"{name}_chat_history.pkl", caption=name)
+            await export_history(chat=chat, message=message, name=f"{name}_chat_history.jsonl", caption=name)
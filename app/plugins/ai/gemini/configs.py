@@ -26,8 +26,10 @@ ENVIRONMENT
 
 CONTEXT ACQUISITION RULES
 
-- On the initial user message, a codebase file will be provided.
-- Treat the resolved codebase contents as definitive for:
+- On the initial user message, either the full codebase file or the project file tree will be provided.
+- If only the file tree is provided, call search_codebase_symbols() to look up the project abstractions,
+  helpers and Pyrogram methods relevant to the request before generating code.
+- Treat the codebase contents and search results as definitive for:
   - file structure and module layout
   - naming conventions
   - import ordering
@@ -40,7 +42,7 @@ PYROGRAM RULES
 
 - If the installed Pyrogram version is newer than your training cutoff or you are uncertain about any API detail, call get_pyro_file_contents() before generating code.
 - Request only the specific Pyrogram source files required for the exact methods or classes you will use.
-- File requests must use the exact absolute paths defined in the Pyrogram path section of the codebase file.
+- File requests must use the exact absolute paths defined in the Pyrogram path section of the codebase file or returned by search_codebase_symbols().
 - Do not construct, infer, normalize, or convert paths.
 - Do not use relative paths.
 - Do not request entire modules or unrelated files.
@@ -76,12 +78,12 @@ OUTPUT FORMAT (STRICT)
 OPERATIONAL CONSTRAINTS
 
 - All reasoning and tool usage must remain internal.
-- The assistant must interpret the codebase from the supplied file.
+- The assistant must interpret the codebase from the supplied file or search results.
 - If required API or context details are missing, call the appropriate tool(s) before emitting code.
 - If required context is missing, do not guess the codebase structure.
 - If the request cannot be satisfied under these constraints, return exactly:
   ERROR: <reason>
-- If the codebase file is missing, return exactly:
+- If neither the codebase file nor the project file tree is present, return exactly:
   ERROR: <reason>
 """
 
@@ -152,37 +154,41 @@ class AIConfig:
         tool_config=types.ToolConfig(function_calling_config=types.FunctionCallingConfig(mode="AUTO")),
     )
 
+    # Flag variants are copied once here, per request code only picks one and must never mutate it.
+    TEXT_SEARCH_CONFIG = TEXT_CONFIG.model_copy(update={"tools": [*TEXT_CONFIG.tools, *SEARCH_TOOLS]})
 
-def get_model_config(flags: list[str]) -> dict:
-    if "-i" in flags:
-        return {"model": Models.IMAGE_MODEL, "config": AIConfig.IMAGE_CONFIG}
+    MALE_AUDIO_CONFIG = AUDIO_CONFIG.model_copy(update={"speech_config": MALE_SPEECH_CONFIG})
 
-    if "-a" in flags:
-        audio_config = AIConfig.AUDIO_CONFIG
+    MULTI_SPEAKER_AUDIO_CONFIG = AUDIO_CONFIG.model_copy(update={"speech_config": MULTI_SPEECH_CONFIG})
 
-        if "-m" in flags:
-            audio_config.speech_config = MALE_SPEECH_CONFIG
-        else:
-            audio_config.speech_config = FEMALE_SPEECH_CONFIG
 
-        return {"model": Models.AUDIO_MODEL, "config": audio_config}
+# config key -> (Models attribute, config), model names are looked up per call as .llms can change them.
+CONFIG_REGISTRY: dict[str, tuple[str, types.GenerateContentConfig]] = {
+    "image": ("IMAGE_MODEL", AIConfig.IMAGE_CONFIG),
+    "audio": ("AUDIO_MODEL", AIConfig.AUDIO_CONFIG),
+    "male_audio": ("AUDIO_MODEL", AIConfig.MALE_AUDIO_CONFIG),
+    "multi_speaker_audio": ("AUDIO_MODEL", AIConfig.MULTI_SPEAKER_AUDIO_CONFIG),
+    "text": ("TEXT_MODEL", AIConfig.TEXT_CONFIG),
+    "text_search": ("TEXT_MODEL", AIConfig.TEXT_SEARCH_CONFIG),
+}
 
-    if "-sp" in flags:
-        AIConfig.AUDIO_CONFIG.speech_config = MULTI_SPEECH_CONFIG
-        return {"model": Models.AUDIO_MODEL, "config": AIConfig.AUDIO_CONFIG}
 
-    update_search_tools_in_place(add="-s" in flags, config_tools=AIConfig.TEXT_CONFIG.tools)
+def get_config_key(flags: list[str]) -> str:
+    if "-i" in flags:
+        return "image"
+
+    if "-a" in flags:
+        return "male_audio" if "-m" in flags else "audio"
 
-    return {"model": Models.TEXT_MODEL, "config": AIConfig.TEXT_CONFIG}
+    if "-sp" in flags:
+        return "multi_speaker_audio"
 
+    return "text_search" if "-s" in flags else "text"
 
-def update_search_tools_in_place(add: bool, config_tools: list):
-    for tool in SEARCH_TOOLS:
-        if add:
-            if tool not in config_tools:
-                config_tools.append(tool)
-        elif tool in config_tools:
-            config_tools.remove(tool)
+
+def get_model_config(flags: list[str]) -> dict:
+    model_key, config = CONFIG_REGISTRY[get_config_key(flags)]
+    return {"model": getattr(Models, model_key), "config": config}
 
 
 def declare_in_tools(tools_list: list[list]):
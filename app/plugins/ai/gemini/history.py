@@ -0,0 +1,174 @@
+import asyncio
+import io
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from google.genai import types
+from google.genai.chats import AsyncChat
+from ub_core import LOGGER, Message, bot
+
+from app.plugins.ai.gemini.client import async_client
+from app.plugins.ai.gemini.models import Models
+from app.plugins.ai.gemini.rate_limit import RATE_LIMITER
+from app.plugins.ai.gemini.response import Response, estimate_tokens
+from app.plugins.ai.gemini.utils import upload_file
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+HISTORY_FILE_NAME = "AI_Chat_History.jsonl"
+HISTORY_SUFFIXES = (".jsonl", ".jsonl.zst")
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPACTION_PROMPT = (
+    "Condense the conversation above into a brief summary that preserves every fact, decision, "
+    "open question and user preference needed to continue it. Reply with only the summary."
+)
+
+
+async def inline_media_to_uri(content: types.Content) -> types.Content:
+    """Uploads inline blobs (generated images, audio) so the export only carries their file URIs."""
+    parts = []
+
+    for part in content.parts or []:
+        if not part.inline_data:
+            parts.append(part)
+            continue
+
+        blob = part.inline_data
+        file = io.BytesIO(blob.data)
+        extension = blob.mime_type.split("/")[-1] if blob.mime_type else "bin"
+
+        try:
+            uploaded_file = await upload_file(file, f"inline.{extension}")
+            parts.append(types.Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type))
+        except Exception as e:
+            LOGGER.error(f"Keeping inline media in history export: {e}")
+            parts.append(part)
+
+    return types.Content(role=content.role, parts=parts)
+
+
+async def dump_history(history: list[types.Content]) -> bytes:
+    contents = await asyncio.gather(*(inline_media_to_uri(content) for content in history))
+    data = "\n".join(content.model_dump_json(exclude_none=True) for content in contents).encode("utf-8")
+
+    if zstandard:
+        data = zstandard.ZstdCompressor(level=10).compress(data)
+
+    return data
+
+
+def iter_history(file: BinaryIO) -> Iterator[types.Content]:
+    """Lazily parses a (optionally zstd compressed) JSON lines history, one Content per line."""
+    if file.read(4) == ZSTD_MAGIC:
+        assert zstandard, "History is zstd compressed, install zstandard to load it."
+        file.seek(0)
+        file = zstandard.ZstdDecompressor().stream_reader(file)
+    else:
+        file.seek(0)
+
+    for line in io.TextIOWrapper(file, encoding="utf-8"):
+        if line.strip():
+            yield types.Content.model_validate_json(line)
+
+
+def window_history(history: list[types.Content], max_turns: int) -> list[types.Content]:
+    """Keeps the last max_turns user turns along with the replies that followed them."""
+    user_turns = [index for index, content in enumerate(history) if content.role == "user"]
+
+    if len(user_turns) <= max_turns:
+        return history
+
+    return history[user_turns[-max_turns] :]
+
+
+def strip_inline_media(content: types.Content) -> types.Content:
+    parts = [types.Part.from_text(text="[media omitted]") if part.inline_data else part for part in content.parts or []]
+    return types.Content(role=content.role, parts=parts)
+
+
+async def drop_expired_files(history: list[types.Content]) -> list[types.Content]:
+    """Replaces file parts whose uploads no longer exist on the server with a text placeholder."""
+    file_uris = list({part.file_data.file_uri for content in history for part in content.parts or [] if part.file_data})
+
+    async def is_alive(uri: str) -> bool:
+        try:
+            await async_client.files.get(name="files/" + uri.rsplit("/", 1)[-1])
+            return True
+        except Exception:
+            return False
+
+    alive = dict(zip(file_uris, await asyncio.gather(*(is_alive(uri) for uri in file_uris)), strict=True))
+
+    return [
+        types.Content(
+            role=content.role,
+            parts=[
+                part
+                if not part.file_data or alive[part.file_data.file_uri]
+                else types.Part.from_text(text="[expired file omitted]")
+                for part in content.parts or []
+            ],
+        )
+        for content in history
+    ]
+
+
+async def compact_history(history: list[types.Content], keep_turns: int) -> list[types.Content]:
+    """
+    Summarizes everything but the last keep_turns user turns into a single context message.
+    Expired file parts of those older turns are dropped first, the API rejects requests that reference them.
+    """
+    recent = window_history(history, keep_turns)
+    older = history[: len(history) - len(recent)]
+
+    if not older:
+        return history
+
+    older = await drop_expired_files(older)
+
+    contents = [
+        *(strip_inline_media(content) for content in older),
+        types.Content(role="user", parts=[types.Part.from_text(text=COMPACTION_PROMPT)]),
+    ]
+    estimated_tokens = estimate_tokens(contents)
+    await RATE_LIMITER.acquire(Models.TEXT_MODEL, estimated_tokens)
+
+    summary_response = Response(await async_client.models.generate_content(model=Models.TEXT_MODEL, contents=contents))
+    RATE_LIMITER.record(Models.TEXT_MODEL, summary_response.total_tokens, estimated_tokens)
+    summary = summary_response.text
+
+    return [
+        types.Content(
+            role="user", parts=[types.Part.from_text(text=f"Summary of our conversation so far:\n{summary}")]
+        ),
+        types.Content(role="model", parts=[types.Part.from_text(text="Got it, I'll continue from there.")]),
+        *recent,
+    ]
+
+
+def is_history_file(file_name: str) -> bool:
+    return file_name.endswith(HISTORY_SUFFIXES)
+
+
+async def export_history(
+    chat: AsyncChat, message: Message, name: str = None, caption: str = None, model: str = Models.TEXT_MODEL
+):
+    """model is the chat's model, only used to pace the caption request."""
+    history = chat.get_history(curated=True)
+    doc = io.BytesIO(await dump_history(history))
+    doc.name = (name or HISTORY_FILE_NAME) + (".zst" if zstandard else "")
+
+    if caption is None:
+        caption_prompt = "Summarize our Conversation into one line."
+        estimated_tokens = estimate_tokens([*history, caption_prompt])
+        await RATE_LIMITER.acquire(model, estimated_tokens)
+
+        caption_response = Response(await chat.send_message(caption_prompt))
+        RATE_LIMITER.record(model, caption_response.total_tokens, estimated_tokens)
+        caption = caption_response.quoted_text()
+
+    await bot.send_document(chat_id=message.from_user.id, document=doc, caption=caption)
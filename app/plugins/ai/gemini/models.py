@@ -1,10 +1,15 @@
 import asyncio
+import time
 
 from app import BOT, CustomDB, Message
 from app.plugins.ai.gemini.client import async_client
 
 DB_SETTINGS = CustomDB["COMMON_SETTINGS"]
 
+MODELS_LIST_TTL = 6 * 60 * 60
+MODELS_LIST_CACHE: dict[str, float | list[str]] = {"fetched_at": 0.0, "models": []}
+MODELS_LIST_LOCK = asyncio.Lock()
+
 
 class Models:
     CODE_MODEL = "gemini-2.5-flash"
@@ -28,12 +33,18 @@ async def init_task():
             setattr(Models, model_info["local_key"], model)
 
 
-async def get_models_list():
-    return [
-        model.name.lstrip("models/")
-        async for model in await async_client.models.list(config={"query_base": True})
-        if "generateContent" in model.supported_actions
-    ]
+async def get_models_list(refresh: bool = False) -> list[str]:
+    """Model catalog rarely changes, so it's fetched once per MODELS_LIST_TTL and shared by concurrent callers."""
+    async with MODELS_LIST_LOCK:
+        if refresh or time.monotonic() - MODELS_LIST_CACHE["fetched_at"] > MODELS_LIST_TTL:
+            MODELS_LIST_CACHE["models"] = [
+                model.name.removeprefix("models/")
+                async for model in await async_client.models.list(config={"query_base": True})
+                if "generateContent" in model.supported_actions
+            ]
+            MODELS_LIST_CACHE["fetched_at"] = time.monotonic()
+
+        return MODELS_LIST_CACHE["models"]
 
 
 @BOT.add_cmd(cmd="llms")
@@ -46,13 +57,15 @@ async def list_ai_models(bot: BOT, message: Message):
         -c to change code model
         -a: to change audio model
         -t: to change text model [default no flag behaviour]
+        -r: re-fetch the model list instead of using the cached one
     USAGE:
         .llms [changes default text model]
         .llms -i | -c | -a
+        .llms -r
     """
-    models = await get_models_list()
+    models = await get_models_list(refresh="-r" in message.flags)
 
-    flag = message.flags[0] if message.flags else None
+    flag = next((flag for flag in message.flags if flag in MODEL_FLAG_MAP), None)
 
     model_info = MODEL_FLAG_MAP.get(flag) or MODEL_FLAG_MAP["-t"]
 
@@ -1,10 +1,29 @@
+import asyncio
+
+from google.genai.types import Part
 from pyrogram.enums import ParseMode
 from pyrogram.types import InputMediaAudio, InputMediaPhoto
 from ub_core import BOT, Message, bot, utils
 
 from app.plugins.ai.gemini import Response, async_client, get_model_config
-from app.plugins.ai.gemini.code import upload_codebase
-from app.plugins.ai.gemini.utils import create_prompts, run_basic_check
+from app.plugins.ai.gemini.code import get_codebase_cache_config, upload_codebase
+from app.plugins.ai.gemini.configs import get_config_key
+from app.plugins.ai.gemini.rate_limit import RATE_LIMITER
+from app.plugins.ai.gemini.response import (
+    estimate_tokens,
+    is_text_only,
+    is_voice_file,
+    stream_response,
+    wrap_in_quote,
+)
+from app.plugins.ai.gemini.utils import (
+    PROMPT_MAP,
+    create_batch_parts,
+    create_prompts,
+    get_batch_messages,
+    run_basic_check,
+)
+from app.plugins.ai.response_cache import TEXT_GENERATORS, generate_text
 
 
 @bot.add_cmd(cmd="ai")
@@ -21,6 +40,8 @@ async def question(bot: BOT, message: Message):
             -f: female voice
         -sp: to create speech between two people
         -wc: uploads ub repo and core and extra modules [ if set ] to ai for context
+        -b: batch mode, sends the replied album or every message from the replied one up to the command in one request
+        -bp: batch mode, but each message gets its own parallel request and the answers are merged into one reply
 
     USAGE:
         .ai what is the meaning of life.
@@ -37,6 +58,9 @@ async def question(bot: BOT, message: Message):
             Jane: Not too bad, how about you?
 
         .ai -wc how does the -wc flag in .ai work, what are the potential usages?
+
+        .ai -b [reply to an album | first message of a range] compare these
+        .ai -bp [reply to the first of many voice notes] (transcribes each one)
     """
 
     reply = message.replied
@@ -49,6 +73,10 @@ async def question(bot: BOT, message: Message):
 
     message_response = await message.reply(resp_str)
 
+    if reply and ("-b" in message.flags or "-bp" in message.flags):
+        await batch_question(message, message_response, quoted_prompt)
+        return
+
     try:
         prompts = await create_prompts(message=message)
     except AssertionError as e:
@@ -58,29 +86,53 @@ async def question(bot: BOT, message: Message):
     kwargs = get_model_config(flags=message.flags)
 
     if "-wc" in message.flags:
-        prompts.append(await upload_codebase())
+        if cached_config := await get_codebase_cache_config(kwargs["model"], kwargs["config"]):
+            kwargs = {**kwargs, "config": cached_config}
+        else:
+            prompts.append(await upload_codebase())
 
-    response = await async_client.models.generate_content(contents=prompts, **kwargs)
+    if is_text_only(kwargs["config"]):
 
-    response = Response(response)
+        async def edit_streamed(text: str):
+            await message_response.edit(
+                text="\n".join((quoted_prompt, wrap_in_quote(text))),
+                parse_mode=ParseMode.MARKDOWN,
+                disable_preview=True,
+            )
+
+        response, _ = await generate_text(
+            provider="gemini",
+            model=kwargs["model"],
+            prompts=prompts,
+            edit_func=edit_streamed,
+            options=f"{get_config_key(message.flags)}:{kwargs['config'].cached_content or ''}",
+            cache_if=lambda resp: not resp.is_empty,
+            config=kwargs["config"],
+        )
+    else:
+        estimated_tokens = estimate_tokens(prompts)
+        await RATE_LIMITER.acquire(kwargs["model"], estimated_tokens)
+        response = Response(await async_client.models.generate_content(contents=prompts, **kwargs))
+        RATE_LIMITER.record(kwargs["model"], response.total_tokens, estimated_tokens)
 
     if response.image:
         await message_response.edit_media(media=InputMediaPhoto(media=response.image_file, caption=quoted_prompt))
         return
 
     if response.audio:
-        if isinstance(message, Message):
+        voice_file = await response.get_voice_file()
+        if isinstance(message, Message) and is_voice_file(voice_file):
             await message.reply_voice(
-                voice=response.audio_file,
-                waveform=response.audio_file.waveform,
-                duration=response.audio_file.duration,
+                voice=voice_file,
+                waveform=voice_file.waveform,
+                duration=voice_file.duration,
                 caption=quoted_prompt,
             )
+        elif isinstance(message, Message):
+            await message.reply_audio(audio=voice_file, duration=voice_file.duration, caption=quoted_prompt)
         else:
             await message_response.edit_media(
-                media=InputMediaAudio(
-                    media=response.audio_file, caption=quoted_prompt, duration=response.audio_file.duration
-                )
+                media=InputMediaAudio(media=voice_file, caption=quoted_prompt, duration=voice_file.duration)
             )
         return
 
@@ -89,3 +141,76 @@ async def question(bot: BOT, message: Message):
         parse_mode=ParseMode.MARKDOWN,
         disable_preview=True,
     )
+
+
+async def generate_gemini_text(model: str, prompts: list, edit_func, config) -> Response:
+    estimated_tokens = estimate_tokens(prompts)
+    await RATE_LIMITER.acquire(model, estimated_tokens)
+
+    response = await stream_response(
+        await async_client.models.generate_content_stream(model=model, contents=prompts, config=config), edit_func
+    )
+    RATE_LIMITER.record(model, response.total_tokens, estimated_tokens)
+    return response
+
+
+TEXT_GENERATORS["gemini"] = generate_gemini_text
+
+
+async def batch_question(message: Message, message_response: Message, quoted_prompt: str):
+    messages = await get_batch_messages(message)
+
+    if not messages:
+        await message_response.edit("<code>No messages found to batch.</code>")
+        return
+
+    kwargs = get_model_config(flags=message.flags)
+
+    await message_response.edit(f"<code>Uploading {len(messages)} messages...</code>")
+    batch_parts = await create_batch_parts(messages)
+
+    async def generate(contents: list[Part]) -> str:
+        estimated_tokens = estimate_tokens(contents)
+        await RATE_LIMITER.acquire(kwargs["model"], estimated_tokens)
+        response = await async_client.models.generate_content(contents=contents, **kwargs)
+
+        if response.usage_metadata and response.usage_metadata.total_token_count:
+            RATE_LIMITER.record(kwargs["model"], response.usage_metadata.total_token_count, estimated_tokens)
+
+        return Response(response).text
+
+    def get_prompt(msg: Message) -> str:
+        media_prompt = msg.media and PROMPT_MAP.get(msg.media.value)
+        return message.filtered_input or media_prompt or "Analyse the file and explain."
+
+    if "-bp" in message.flags:
+
+        async def answer(msg: Message, parts: list[Part] | Exception) -> str:
+            if isinstance(parts, Exception):
+                return f"Error: {parts}"
+
+            try:
+                return await generate([Part.from_text(text=get_prompt(msg)), *parts])
+            except Exception as e:
+                return f"Error: {e}"
+
+        await message_response.edit(f"<code>Processing {len(messages)} messages...</code>")
+        answers = await asyncio.gather(*(answer(msg, parts) for msg, parts in zip(messages, batch_parts, strict=True)))
+        text = "\n\n".join(f"**{index}.** {text}" for index, text in enumerate(answers, start=1))
+
+    else:
+        contents = [Part.from_text(text=message.filtered_input or "Analyse each of the following items.")]
+        for index, parts in enumerate(batch_parts, start=1):
+            contents.append(Part.from_text(text=f"Item {index}:"))
+            if isinstance(parts, Exception):
+                contents.append(Part.from_text(text=f"[failed to load: {parts}]"))
+            else:
+                contents.extend(parts)
+
+        text = await generate(contents)
+
+    await message_response.edit(
+        text="\n".join((quoted_prompt, wrap_in_quote(text))),
+        parse_mode=ParseMode.MARKDOWN,
+        disable_preview=True,
+    )
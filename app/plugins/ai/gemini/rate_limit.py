@@ -0,0 +1,79 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from app import extra_config
+
+
+class TokenBucket:
+    """Continuously refilling bucket, capacity units per period seconds."""
+
+    def __init__(self, capacity: float, period: float = 60):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        self.refill()
+        # Never wait for more than a full bucket, oversized requests go through once it's full.
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        self.refill()
+        self.tokens -= amount
+
+
+class ModelLimits:
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+
+class RateLimiter:
+    """
+    Per model requests-per-minute and tokens-per-minute buckets.
+    Server side RetryInfo delays block the model for every caller, not just the one that hit it.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._limits: dict[str, ModelLimits] = defaultdict(lambda: ModelLimits(self.rpm, self.tpm))
+
+    async def acquire(self, model: str, estimated_tokens: int = 0):
+        limits = self._limits[model]
+
+        async with limits.lock:
+            while True:
+                wait = max(
+                    limits.blocked_until - time.monotonic(),
+                    limits.requests.time_until(1),
+                    limits.tokens.time_until(estimated_tokens),
+                )
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+
+            limits.requests.consume(1)
+            limits.tokens.consume(estimated_tokens)
+
+    def record(self, model: str, used_tokens: int, estimated_tokens: int = 0):
+        """Corrects the token bucket with the actual usage reported by the API, unreported usage keeps the estimate."""
+        if used_tokens:
+            self._limits[model].tokens.consume(used_tokens - estimated_tokens)
+
+    def block(self, model: str, delay: float):
+        limits = self._limits[model]
+        limits.blocked_until = max(limits.blocked_until, time.monotonic() + delay)
+
+
+RATE_LIMITER = RateLimiter(rpm=extra_config.GEMINI_RPM, tpm=extra_config.GEMINI_TPM)
@@ -1,21 +1,32 @@
 import asyncio
+import inspect
 import io
-import pickle
 import wave
-from collections.abc import Callable
+from collections.abc import AsyncIterator, Awaitable, Callable
 from functools import cached_property
 
 import numpy as np
 from google.genai import types
 from google.genai.chats import AsyncChat
-from google.genai.errors import ClientError
+from google.genai.errors import ClientError, ServerError
 from pyrogram.enums import ParseMode
-from ub_core import LOGGER, CustomDB, Message, bot, utils
+from pyrogram.errors import FloodWait
+from ub_core import LOGGER, CustomDB, utils
+
+from app.plugins.ai.gemini.rate_limit import RATE_LIMITER
 
 DB_SETTINGS = CustomDB["COMMON_SETTINGS"]
 
 FUNCTION_CALL_MAP: dict[str, Callable] = {}
 
+MAX_RETRIES = 4
+
+# Min gap between edits of a streamed reply, keeps edits clear of flood waits.
+STREAM_EDIT_INTERVAL = 1.5
+
+# Stop live edits before hitting TG's message length limit, the final edit takes over.
+STREAM_EDIT_MAX_LENGTH = 4000
+
 
 def wrap_in_quote(text: str, mode: ParseMode = ParseMode.MARKDOWN):
     _text = text.strip()
@@ -31,6 +42,26 @@ def wrap_in_quote(text: str, mode: ParseMode = ParseMode.MARKDOWN):
             return _text
 
 
+PCM_FORMATS = {1: ("s8", np.int8), 2: ("s16le", np.int16), 4: ("s32le", np.int32)}
+
+
+def get_waveform(pcm: bytes, sample_width: int = 2, bars: int = 80) -> bytes:
+    """Mean amplitude per bar in one reduce, the tail samples are folded into the last bar."""
+    samples = np.abs(np.frombuffer(pcm, dtype=PCM_FORMATS[sample_width][1]).astype(np.int64))
+
+    if not len(samples):
+        return b""
+
+    chunk_size = max(1, len(samples) // bars)
+    starts = np.arange(0, min(len(samples), chunk_size * bars), chunk_size)
+    counts = np.diff(np.append(starts, len(samples)))
+
+    means = np.add.reduceat(samples, starts) / counts
+    scaled = np.minimum(255, means / (2 ** (8 * sample_width - 1)) * 255)
+
+    return scaled.astype(np.uint8).tobytes()
+
+
 def save_wave_file(pcm, channels=1, rate=24000, sample_width=2) -> io.BytesIO:
     file = io.BytesIO()
 
@@ -41,27 +72,48 @@ def save_wave_file(pcm, channels=1, rate=24000, sample_width=2) -> io.BytesIO:
         wf.writeframes(pcm)
 
     n_samples = len(pcm) // (sample_width * channels)
-    duration = n_samples / rate
 
-    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[sample_width]
-    samples = np.frombuffer(pcm, dtype=dtype)
+    file.name = "audio.wav"
+    file.waveform = get_waveform(pcm, sample_width)
+    file.duration = round(n_samples / rate)
+
+    return file
 
-    chunk_size = max(1, len(samples) // 80)
 
-    # fmt: off
-    data = [
-        int(min(255,np.abs(samples[i : i + chunk_size]).mean() / (2 ** (8 * sample_width - 1)) * 255))
-        for i in range(0, len(samples), chunk_size)
-    ]
-    # fmt: on
+async def save_voice_file(pcm, channels=1, rate=24000, sample_width=2) -> io.BytesIO:
+    """
+    Encodes raw PCM into an Opus OGG voice note, falls back to WAV if ffmpeg is unavailable.
+    TG only plays OGG as a voice note, check is_voice_file before choosing how to send it.
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *("ffmpeg", "-hide_banner", "-loglevel", "error"),
+            *("-f", PCM_FORMATS[sample_width][0], "-ar", str(rate), "-ac", str(channels), "-i", "pipe:0"),
+            *("-c:a", "libopus", "-b:a", "32k", "-application", "voip", "-f", "ogg", "pipe:1"),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        ogg, error = await process.communicate(pcm)
+        assert process.returncode == 0 and ogg, error.decode(errors="ignore")
+    except (OSError, AssertionError) as e:
+        LOGGER.error(f"Opus encoding failed, sending wav: {e}")
+        return save_wave_file(pcm, channels=channels, rate=rate, sample_width=sample_width)
+
+    n_samples = len(pcm) // (sample_width * channels)
 
+    file = io.BytesIO(ogg)
     file.name = "audio.ogg"
-    file.waveform = bytes(data)[:80]
-    file.duration = round(duration)
+    file.waveform = get_waveform(pcm, sample_width)
+    file.duration = round(n_samples / rate)
 
     return file
 
 
+def is_voice_file(file: io.BytesIO) -> bool:
+    return file.name.endswith(".ogg")
+
+
 class Response:
     def __init__(self, ai_response: types.GenerateContentResponse):
         self._ai_response = ai_response
@@ -116,14 +168,23 @@ class Response:
             return "audio" in self._inline_data.mime_type
         return False
 
-    @property
-    def audio_file(self) -> io.BytesIO | None:
+    async def get_voice_file(self) -> io.BytesIO | None:
         inline_data = self._inline_data
-        return save_wave_file(inline_data.data) if inline_data else None
+        return await save_voice_file(inline_data.data) if inline_data else None
+
+    @property
+    def total_tokens(self) -> int:
+        """Prompt plus reply tokens, roughly what the next turn of a chat will send."""
+        usage_metadata = self._ai_response.usage_metadata
+        return (usage_metadata and usage_metadata.total_token_count) or 0
+
+    @cached_property
+    def function_call_parts(self) -> list[types.Part]:
+        return [part for part in self.first_parts if part.function_call]
 
     @property
     def function_call(self):
-        return bool(self.first_part.function_call)
+        return bool(self.function_call_parts)
 
     def quoted_text(self, quote_mode: ParseMode | None = ParseMode.MARKDOWN) -> str:
         if self.is_empty:
@@ -148,41 +209,41 @@ class Response:
             return self.quoted_text(quote_mode=quote_mode)
 
     async def execute_function_call(self):
-        call = self.first_part.function_call
-        func_name = call.name
+        """Runs every function call of the response concurrently and returns the calls with their results."""
+        results = await asyncio.gather(*(run_function_call(part.function_call) for part in self.function_call_parts))
+        return [*self.function_call_parts, *results]
 
-        LOGGER.info(call)
 
-        if func_name in FUNCTION_CALL_MAP:
-            try:
-                result = await utils.run_unknown_callable(FUNCTION_CALL_MAP[func_name], **call.args)
-            except Exception as e:
-                LOGGER.error(e, exec_info=True)
-                result = f"Error occurred while running function: {e}"
+async def run_function_call(call: types.FunctionCall) -> types.Part:
+    func_name = call.name
+    func = FUNCTION_CALL_MAP.get(func_name)
 
-        else:
-            result = "Error: Function not found in backend function map."
+    LOGGER.info(call)
 
-        return [self.first_part, types.Part.from_function_response(name=func_name, response={"result": result})]
+    if func is None:
+        result = "Error: Function not found in backend function map."
 
+    else:
+        try:
+            if inspect.iscoroutinefunction(func):
+                result = await func(**(call.args or {}))
+            else:
+                result = await asyncio.to_thread(func, **(call.args or {}))
+        except Exception as e:
+            LOGGER.error(e, exc_info=True)
+            result = f"Error occurred while running function: {e}"
 
-async def send_message_with_retry_delay_guard(chat, response, parts, tg_convo) -> Response:
-    max_calls = 0
+    return types.Part.from_function_response(name=func_name, response={"result": result})
 
-    while max_calls < 10:
-        try:
-            if response and response.function_call:
-                parts = await response.execute_function_call()
 
-            response = Response(await chat.send_message(message=parts))
+async def send_message_with_retry_delay_guard(chat, response, parts, tg_convo, model: str) -> Response:
+    max_calls = 0
 
-        except ClientError as e:
-            delay = get_retry_delay(e.details)
-            await tg_convo.send_message(f"Gemini API returned flood wait of {delay}s sleeping...")
-            await asyncio.sleep(delay + 10)
-            response = Response(await chat.send_message(message=parts))
+    while max_calls < 10:
+        if response and response.function_call:
+            parts = await response.execute_function_call()
 
-        await asyncio.sleep(10)
+        response = await send_message_with_rate_limit(chat=chat, parts=parts, model=model, tg_convo=tg_convo)
 
         max_calls += 1
 
@@ -190,6 +251,155 @@ async def send_message_with_retry_delay_guard(chat, response, parts, tg_convo) -
             return response
 
 
+async def send_message_with_rate_limit(
+    chat: AsyncChat, parts, model: str, tg_convo=None, max_retries: int = MAX_RETRIES
+) -> Response:
+    """
+    Paces chat.send_message through the shared per model rate limiter.
+    429s block the model for the server's RetryInfo delay, other transient errors
+    back-off exponentially, both for at most max_retries attempts.
+    """
+    estimated_tokens = estimate_tokens(parts)
+
+    for attempt in range(max_retries + 1):
+        await RATE_LIMITER.acquire(model, estimated_tokens)
+
+        try:
+            response = await chat.send_message(message=parts)
+        except (ClientError, ServerError) as e:
+            if attempt == max_retries or (isinstance(e, ClientError) and e.code != 429):
+                raise
+
+            delay = (get_retry_delay(e.details) if isinstance(e, ClientError) else 0) or 2**attempt
+            RATE_LIMITER.block(model, delay)
+
+            if tg_convo:
+                await tg_convo.send_message(f"Gemini API returned flood wait of {delay}s sleeping...")
+            continue
+
+        if response.usage_metadata and response.usage_metadata.total_token_count:
+            RATE_LIMITER.record(model, response.usage_metadata.total_token_count, estimated_tokens)
+
+        return Response(response)
+
+
+def estimate_tokens(parts) -> int:
+    """
+    Rough pre-flight estimate, ~4 chars per token for text. File tokens are corrected after the call.
+    Contents are counted by their parts, so a whole chat history can be passed.
+    """
+    if not isinstance(parts, list):
+        parts = [parts]
+
+    tokens = 0
+
+    for part in parts:
+        if isinstance(part, types.Content):
+            tokens += estimate_tokens(part.parts or [])
+        elif isinstance(part, str):
+            tokens += len(part) // 4
+        elif isinstance(getattr(part, "text", None), str):
+            tokens += len(part.text) // 4
+
+    return tokens
+
+
+def is_text_only(config: types.GenerateContentConfig) -> bool:
+    return [modality.lower() for modality in config.response_modalities or []] == ["text"]
+
+
+def get_text_delta(chunk: types.GenerateContentResponse) -> str:
+    try:
+        parts = chunk.candidates[0].content.parts or []
+    except (IndexError, TypeError, AttributeError):
+        return ""
+    return "".join(part.text for part in parts if isinstance(part.text, str) and not part.thought)
+
+
+def merge_stream_chunks(chunks: list[types.GenerateContentResponse]) -> types.GenerateContentResponse:
+    """Combines streamed chunks into a single response so it can be wrapped in Response."""
+    text_parts = []
+    other_parts = []
+    grounding_metadata = usage_metadata = None
+
+    for chunk in chunks:
+        usage_metadata = chunk.usage_metadata or usage_metadata
+
+        if not chunk.candidates:
+            continue
+
+        candidate = chunk.candidates[0]
+        grounding_metadata = candidate.grounding_metadata or grounding_metadata
+
+        if not (candidate.content and candidate.content.parts):
+            continue
+
+        for part in candidate.content.parts:
+            if isinstance(part.text, str) and not part.thought:
+                text_parts.append(part.text)
+            else:
+                other_parts.append(part)
+
+    parts = [types.Part.from_text(text="".join(text_parts))] if text_parts else []
+    parts.extend(other_parts)
+
+    return types.GenerateContentResponse(
+        candidates=[
+            types.Candidate(content=types.Content(role="model", parts=parts), grounding_metadata=grounding_metadata)
+        ],
+        usage_metadata=usage_metadata,
+    )
+
+
+async def stream_response(
+    stream: AsyncIterator[types.GenerateContentResponse],
+    edit_func: Callable[[str], Awaitable],
+    interval: float = STREAM_EDIT_INTERVAL,
+) -> Response:
+    """Streams a Gemini response into edit_func and returns the merged Response for the final edit."""
+    chunks = []
+
+    async def text_deltas():
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield get_text_delta(chunk)
+
+    await edit_streamed_text(text_deltas(), edit_func, interval)
+    return Response(merge_stream_chunks(chunks))
+
+
+async def edit_streamed_text(
+    text_deltas: AsyncIterator[str],
+    edit_func: Callable[[str], Awaitable],
+    interval: float = STREAM_EDIT_INTERVAL,
+) -> str:
+    """
+    Calls edit_func with the text generated so far,
+    at most once per interval and backing off on FloodWait.
+    Returns the full text.
+    """
+    loop = asyncio.get_running_loop()
+    text = ""
+    next_edit_at = 0
+
+    async for delta in text_deltas:
+        text += delta
+
+        if not text or len(text) > STREAM_EDIT_MAX_LENGTH or loop.time() < next_edit_at:
+            continue
+
+        try:
+            await edit_func(text)
+            next_edit_at = loop.time() + interval
+        except FloodWait as e:
+            next_edit_at = loop.time() + e.value
+        except Exception as e:
+            LOGGER.debug(f"Skipped streamed edit: {e}")
+            next_edit_at = loop.time() + interval
+
+    return text
+
+
 def get_retry_delay(response_json: dict) -> float:
     error = response_json.get("error", {})
     details = error.get("details", [])
@@ -198,11 +408,3 @@ def get_retry_delay(response_json: dict) -> float:
             return float(err["retryDelay"].strip("s"))
     else:
         return 0
-
-
-async def export_history(chat: AsyncChat, message: Message, name: str = None, caption: str = None):
-    doc = io.BytesIO(pickle.dumps(chat.get_history(curated=True)))
-    doc.name = name or "AI_Chat_History.pkl"
-    if caption is None:
-        Response(await chat.send_message("Summarize our Conversation into one line.")).quoted_text()
-    await bot.send_document(chat_id=message.from_user.id, document=doc, caption=caption)
@@ -0,0 +1,175 @@
+import ast
+import math
+import pathlib
+import re
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+
+TOKEN_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+MAX_DOC_CHARS = 400
+MAX_SOURCE_LINES = 40
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits snake_case, CamelCase and prose into lowercase terms."""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+class Symbol:
+    __slots__ = ("path", "qualname", "kind", "signature", "docstring", "lineno", "source")
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        qualname: str,
+        kind: str,
+        signature: str,
+        docstring: str,
+        lineno: int,
+        source: str | None = None,
+    ):
+        self.path = path
+        self.qualname = qualname
+        self.kind = kind
+        self.signature = signature
+        self.docstring = docstring
+        self.lineno = lineno
+        self.source = source
+
+    def terms(self) -> list[str]:
+        # Names matter more than prose, count them twice.
+        name_terms = tokenize(self.qualname) + tokenize(self.path.stem)
+        return name_terms * 2 + tokenize(self.signature) + tokenize(self.docstring)
+
+    def format(self) -> str:
+        parts = [f"### {self.path}:{self.lineno} [{self.kind}] {self.qualname}", self.signature]
+        if self.docstring:
+            parts.append(f'"""{self.docstring}"""')
+        if self.source:
+            parts.append(self.source)
+        return "\n".join(parts)
+
+
+def get_signature(node: ast.AST) -> str:
+    if isinstance(node, ast.ClassDef):
+        bases = ", ".join(ast.unparse(base) for base in node.bases)
+        signature = f"class {node.name}({bases})" if bases else f"class {node.name}"
+
+        for child in node.body:
+            if isinstance(child, ast.FunctionDef) and child.name == "__init__":
+                signature += f": __init__({ast.unparse(child.args)})"
+                break
+
+        return signature
+
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def get_docstring(node: ast.AST) -> str:
+    docstring = ast.get_docstring(node) or ""
+    return " ".join(docstring.split())[:MAX_DOC_CHARS]
+
+
+def parse_symbols(
+    file: pathlib.Path, with_source: bool = False, exclude_names: frozenset[str] = frozenset()
+) -> list[Symbol]:
+    source = file.read_text(encoding="utf-8", errors="ignore")
+
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return []
+
+    lines = source.splitlines()
+    symbols = []
+
+    def visit(body: list[ast.stmt], prefix: str = ""):
+        for node in body:
+            if not isinstance(node, ast.ClassDef | ast.FunctionDef | ast.AsyncFunctionDef):
+                continue
+
+            if node.name.startswith("_") or node.name in exclude_names:
+                continue
+
+            qualname = f"{prefix}{node.name}"
+            kind = "class" if isinstance(node, ast.ClassDef) else "method" if prefix else "function"
+
+            snippet = None
+            if with_source and kind != "class" and node.end_lineno - node.lineno < MAX_SOURCE_LINES:
+                snippet = "\n".join(lines[node.lineno - 1 : node.end_lineno])
+
+            symbols.append(
+                Symbol(
+                    path=file,
+                    qualname=qualname,
+                    kind=kind,
+                    signature=get_signature(node),
+                    docstring=get_docstring(node),
+                    lineno=node.lineno,
+                    source=snippet,
+                )
+            )
+
+            if isinstance(node, ast.ClassDef):
+                visit(node.body, prefix=f"{qualname}.")
+
+    visit(tree.body)
+    return symbols
+
+
+class SymbolIndex:
+    """A BM25 index over classes, functions and methods of python source trees."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.symbols: list[Symbol] = []
+        self.postings: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self.doc_lengths: list[int] = []
+        self.avg_doc_length = 0.0
+
+    def build(
+        self,
+        files: Iterable[pathlib.Path],
+        with_source: bool = False,
+        exclude_names: frozenset[str] = frozenset(),
+    ) -> "SymbolIndex":
+        for file in files:
+            for symbol in parse_symbols(file, with_source=with_source, exclude_names=exclude_names):
+                self.add(symbol)
+
+        if self.doc_lengths:
+            self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths)
+        return self
+
+    def add(self, symbol: Symbol):
+        doc_id = len(self.symbols)
+        terms = symbol.terms()
+
+        self.symbols.append(symbol)
+        self.doc_lengths.append(len(terms))
+
+        for term, frequency in Counter(terms).items():
+            self.postings[term].append((doc_id, frequency))
+
+    def search(self, query: str, limit: int = 10) -> list[Symbol]:
+        total_docs = len(self.symbols)
+        scores: dict[int, float] = defaultdict(float)
+
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+
+            if not postings:
+                continue
+
+            idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+
+            for doc_id, frequency in postings:
+                norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_doc_length
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [self.symbols[doc_id] for doc_id, _ in ranked[:limit]]
@@ -1,18 +1,51 @@
 import asyncio
 import io
-import os.path
 import pathlib
-import shutil
-import time
+from datetime import UTC, datetime, timedelta
 from functools import wraps
 from mimetypes import guess_type
 
+import aiohttp
 from google.genai.types import File, Part
+from pyrogram.enums import ChatType
 from ub_core.utils import get_tg_media_details
 
-from app import BOT, Message, extra_config
+from app import BOT, Config, CustomDB, Message, extra_config
 from app.plugins.ai.gemini import async_client
 
+FILE_CACHE = CustomDB["GEMINI_FILE_CACHE"]
+
+UPLOAD_URL = "https://generativelanguage.googleapis.com/upload/v1beta/files"
+
+# Resumable uploads only accept non-final chunks in multiples of this size.
+DEFAULT_CHUNK_GRANULARITY = 8388608
+
+# Don't hand out files that are about to expire mid conversation.
+FILE_EXPIRY_MARGIN = timedelta(minutes=30)
+
+POLL_MIN_INTERVAL = 0.25
+POLL_MAX_INTERVAL = 5
+PROCESSING_TIMEOUT = 300
+
+BATCH_LIMIT = 50
+BATCH_UPLOAD_CONCURRENCY = 5
+
+# Only here are message ids per chat, elsewhere they are shared by every chat of the account.
+ID_RANGE_CHAT_TYPES = {ChatType.SUPERGROUP, ChatType.CHANNEL}
+
+# No total limit, large uploads legitimately take long, only a stalled connection should fail.
+UPLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=120)
+
+_AIOHTTP_SESSION: aiohttp.ClientSession | None = None
+
+
+def get_aiohttp_session() -> aiohttp.ClientSession:
+    global _AIOHTTP_SESSION
+    if _AIOHTTP_SESSION is None:
+        _AIOHTTP_SESSION = aiohttp.ClientSession(timeout=UPLOAD_TIMEOUT)
+        Config.TASK_MANAGER.add_exit(_AIOHTTP_SESSION.close)
+    return _AIOHTTP_SESSION
+
 
 def run_basic_check(function):
     @wraps(function)
@@ -35,33 +68,153 @@ def run_basic_check(function):
 
 async def upload_file(file: io.BytesIO | pathlib.Path | str, file_name: str) -> File:
     uploaded_file = await async_client.files.upload(file=file, config={"mime_type": guess_type(file_name)[0]})
+    return await wait_till_processed(uploaded_file)
+
+
+async def wait_till_processed(uploaded_file: File, timeout: float = PROCESSING_TIMEOUT) -> File:
+    """
+    Polls the file with exponential back-off until it leaves the PROCESSING state.
+    Starts at sub-second intervals so small files are ready almost instantly.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    interval = POLL_MIN_INTERVAL
+
     while uploaded_file.state.name == "PROCESSING":
-        await asyncio.sleep(5)
+        remaining = deadline - loop.time()
+
+        # Not TimeoutError, callers treat that as the conversation going idle.
+        assert remaining > 0, f"File {uploaded_file.name} still processing after {timeout}s."
+
+        await asyncio.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX_INTERVAL)
         uploaded_file = await async_client.files.get(name=uploaded_file.name)
 
+    assert uploaded_file.state.name != "FAILED", "Gemini failed to process the file."
     return uploaded_file
 
 
 async def upload_tg_file(message: Message, check_size: bool = True) -> File:
     media = get_tg_media_details(message)
+    file_size = getattr(media, "file_size", 0)
+
+    # The resumable upload declares the size up front, the server rejects the upload if it doesn't match.
+    assert file_size, "Couldn't get the size of the replied media."
 
     if check_size:
-        assert getattr(media, "file_size", 0) <= 1048576 * 25, "File size exceeds 25mb."
+        assert file_size <= 1048576 * 25, "File size exceeds 25mb."
+
+    if cached_file := await get_cached_file(media.file_unique_id):
+        return cached_file
+
+    file_name = getattr(media, "file_name", None) or f"{message.media.value}_{message.id}"
+
+    if message.media.value == "photo":
+        mime_type = "image/jpeg"
+    else:
+        mime_type = getattr(media, "mime_type", None) or guess_type(file_name)[0] or "application/octet-stream"
+
+    uploaded_file = await stream_upload(
+        chunks=message._client.stream_media(message=message),
+        file_name=file_name,
+        file_size=file_size,
+        mime_type=mime_type,
+    )
+    uploaded_file = await wait_till_processed(uploaded_file)
+    await cache_file(media.file_unique_id, uploaded_file)
+    return uploaded_file
+
+
+async def get_cached_file(file_unique_id: str) -> File | None:
+    cached_file = await FILE_CACHE.find_one({"_id": file_unique_id})
+
+    if not cached_file:
+        return None
+
+    expiration_time = datetime.fromtimestamp(cached_file["expiration_time"], tz=UTC)
 
-    download_dir = None
-    try:
-        if getattr(media, "file_size", 0) < 500_000:
-            downloaded_file: io.BytesIO = await message.download(in_memory=True)
-            file_name = downloaded_file.name
-        else:
-            download_dir = f"downloads/{time.time()}/"
-            downloaded_file: str = await message.download(download_dir)
-            file_name = os.path.basename(downloaded_file)
+    if expiration_time - FILE_EXPIRY_MARGIN <= datetime.now(UTC):
+        await FILE_CACHE.delete_data(id=file_unique_id)
+        return None
 
-        return await upload_file(downloaded_file, file_name)
-    finally:
-        if download_dir:
-            shutil.rmtree(download_dir, ignore_errors=True)
+    return File(
+        name=cached_file["name"],
+        uri=cached_file["uri"],
+        mime_type=cached_file["mime_type"],
+        expiration_time=expiration_time,
+    )
+
+
+async def cache_file(file_unique_id: str, file: File):
+    if (file.state and file.state.name != "ACTIVE") or not file.expiration_time:
+        return
+
+    await FILE_CACHE.add_data(
+        {
+            "_id": file_unique_id,
+            "name": file.name,
+            "uri": file.uri,
+            "mime_type": file.mime_type,
+            "expiration_time": file.expiration_time.timestamp(),
+        }
+    )
+
+
+async def stream_upload(chunks, file_name: str, file_size: int, mime_type: str) -> File:
+    """
+    Feeds an async iterator of bytes into a resumable Gemini file upload.
+    Chunks are sent as soon as enough data for the server's chunk granularity is buffered.
+    """
+    session = get_aiohttp_session()
+
+    start_headers = {
+        "x-goog-api-key": extra_config.GEMINI_API_KEY,
+        "X-Goog-Upload-Protocol": "resumable",
+        "X-Goog-Upload-Command": "start",
+        "X-Goog-Upload-Header-Content-Length": str(file_size),
+        "X-Goog-Upload-Header-Content-Type": mime_type,
+    }
+    async with session.post(UPLOAD_URL, headers=start_headers, json={"file": {"display_name": file_name}}) as resp:
+        if resp.status != 200:
+            text = await resp.text()
+            raise Exception(f"Initiate failed: {text}")
+        upload_url = resp.headers["X-Goog-Upload-URL"]
+        granularity = int(resp.headers.get("X-Goog-Upload-Chunk-Granularity", DEFAULT_CHUNK_GRANULARITY))
+
+    offset = 0
+    buffer = b""
+
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) < granularity:
+            continue
+
+        sendable = len(buffer) - len(buffer) % granularity
+        await upload_chunk(upload_url, buffer[:sendable], offset, finalize=False)
+        offset += sendable
+        buffer = buffer[sendable:]
+
+    return await upload_chunk(upload_url, buffer, offset, finalize=True)
+
+
+async def upload_chunk(upload_url: str, chunk: bytes, offset: int, finalize: bool) -> File | None:
+    headers = {
+        "X-Goog-Upload-Command": "upload, finalize" if finalize else "upload",
+        "X-Goog-Upload-Offset": str(offset),
+        "Content-Length": str(len(chunk)),
+    }
+    async with get_aiohttp_session().post(upload_url, headers=headers, data=chunk) as resp:
+        status = resp.headers.get("X-Goog-Upload-Status")
+
+        if resp.status != 200 or status not in ("active", "final"):
+            text = await resp.text()
+            raise Exception(f"Chunk upload failed with {resp.status}: {text}")
+
+        if not finalize:
+            return None
+
+        response_json = await resp.json()
+        return File.model_validate(response_json["file"])
 
 
 PROMPT_MAP = {
@@ -104,3 +257,44 @@ async def create_prompts(message: Message, is_chat: bool = False, check_size: bo
         return [Part.from_text(text=input_prompt), Part.from_text(text=str(reply.text))]
 
     return [Part.from_text(text=input_prompt)]
+
+
+async def get_batch_messages(message: Message) -> list[Message]:
+    """Returns the replied album, or every message from the replied one up to the command."""
+    reply = message.replied
+
+    if reply.media_group_id:
+        return (await reply.get_media_group())[:BATCH_LIMIT]
+
+    if message.chat.type in ID_RANGE_CHAT_TYPES:
+        message_ids = list(range(reply.id, message.id))[:BATCH_LIMIT]
+        messages = await message._client.get_messages(chat_id=message.chat.id, message_ids=message_ids)
+    else:
+        history = message._client.get_chat_history(chat_id=message.chat.id, min_id=reply.id - 1, max_id=message.id)
+        # History comes newest first, BATCH_LIMIT counts from the replied message.
+        messages = [msg async for msg in history if msg.id != message.id][::-1]
+
+    batch = [msg for msg in messages if msg and not msg.empty and (msg.media or msg.text)]
+    return batch[:BATCH_LIMIT]
+
+
+async def create_batch_parts(messages: list[Message], check_size: bool = True) -> list[list[Part] | Exception]:
+    """
+    Converts each message into its own prompt parts, uploading media concurrently.
+    At most BATCH_UPLOAD_CONCURRENCY downloads/uploads run at once, failures are returned in place.
+    """
+    semaphore = asyncio.Semaphore(BATCH_UPLOAD_CONCURRENCY)
+
+    async def to_parts(msg: Message) -> list[Part]:
+        if not msg.media:
+            return [Part.from_text(text=str(msg.text))]
+
+        async with semaphore:
+            uploaded_file = await upload_tg_file(message=msg, check_size=check_size)
+
+        parts = [Part.from_uri(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type)]
+        if msg.caption:
+            parts.append(Part.from_text(text=str(msg.caption)))
+        return parts
+
+    return await asyncio.gather(*(to_parts(msg) for msg in messages), return_exceptions=True)
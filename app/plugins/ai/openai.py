@@ -2,12 +2,15 @@ from base64 import b64decode
 from io import BytesIO
 from os import getenv
 
+import httpx
 import openai
 from pyrogram.enums import ParseMode
 from pyrogram.types import InputMediaPhoto
-from ub_core import BOT, Message, utils
+from ub_core import BOT, Config, Message, utils
 
 from app.plugins.ai.gemini.configs import SYSTEM_INSTRUCTION
+from app.plugins.ai.gemini.response import edit_streamed_text, wrap_in_quote
+from app.plugins.ai.response_cache import TEXT_GENERATORS, generate_text
 
 OPENAI_CLIENT = getenv("OPENAI_CLIENT", "")
 OPENAI_MODEL = getenv("OPENAI_MODEL", "gpt-4o")
@@ -31,15 +34,59 @@ else:
     text_init_kwargs = dict(api_key=getenv("OPENAI_API_KEY"), base_url=getenv("OPENAI_BASE_URL"))
     image_init_kwargs = dict(api_key=getenv("DALL_E_API_KEY"), base_url=getenv("DALL_E_ENDPOINT"))
 
-try:
-    TEXT_CLIENT = AI_CLIENT(**text_init_kwargs)
-except:
-    TEXT_CLIENT = None
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120)
+HTTP_TIMEOUT = httpx.Timeout(120, connect=10)
 
-try:
-    DALL_E_CLIENT = AI_CLIENT(**image_init_kwargs)
-except:
-    DALL_E_CLIENT = None
+_HTTP_CLIENT: httpx.AsyncClient | None = None
+_CLIENTS: dict[str, openai.AsyncOpenAI | None] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """One keep-alive connection pool shared by the text and image clients."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = openai.DefaultAsyncHttpxClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        Config.TASK_MANAGER.add_exit(_HTTP_CLIENT.aclose)
+    return _HTTP_CLIENT
+
+
+def get_client(name: str, init_kwargs: dict) -> openai.AsyncOpenAI | None:
+    """Clients are only built on first use, unset or invalid creds are remembered as None."""
+    if name not in _CLIENTS:
+        try:
+            _CLIENTS[name] = AI_CLIENT(**init_kwargs, http_client=get_http_client())
+        except Exception:
+            _CLIENTS[name] = None
+    return _CLIENTS[name]
+
+
+def get_text_client() -> openai.AsyncOpenAI | None:
+    return get_client("text", text_init_kwargs)
+
+
+def get_dall_e_client() -> openai.AsyncOpenAI | None:
+    return get_client("dall_e", image_init_kwargs)
+
+
+async def generate_openai_text(model: str, prompts: list[str], edit_func) -> str:
+    stream = await get_text_client().chat.completions.create(
+        messages=[
+            {"role": "system", "content": SYSTEM_INSTRUCTION},
+            *({"role": "user", "content": prompt} for prompt in prompts),
+        ],
+        model=model,
+        stream=True,
+    )
+
+    async def text_deltas():
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    return await edit_streamed_text(text_deltas(), edit_func)
+
+
+TEXT_GENERATORS[f"openai{OPENAI_CLIENT}"] = generate_openai_text
 
 
 @BOT.add_cmd(cmd="gpt")
@@ -68,7 +115,9 @@ async def chat_gpt(bot: BOT, message: Message):
         .gpt hi
         .gpt [reply to a message]
     """
-    if TEXT_CLIENT is None:
+    text_client = get_text_client()
+
+    if text_client is None:
         await message.reply("OpenAI Creds not set or are invalid.\nCheck Help.")
         return
 
@@ -80,15 +129,17 @@ async def chat_gpt(bot: BOT, message: Message):
         await message.reply("Ask a Question | Reply to a message.")
         return
 
-    chat_completion = await TEXT_CLIENT.chat.completions.create(
-        messages=[{"role": "system", "content": SYSTEM_INSTRUCTION}, {"role": "user", "content": prompt}],
-        model=OPENAI_MODEL,
-    )
-
-    response = chat_completion.choices[0].message.content
     quoted_prompt = utils.wrap_in_block_quote(prompt, "**>", "<**")
+    reply = await message.reply(text=quoted_prompt, parse_mode=ParseMode.MARKDOWN)
+
+    async def edit_streamed(text: str):
+        await reply.edit(text="\n".join((quoted_prompt, wrap_in_quote(text))), parse_mode=ParseMode.MARKDOWN)
+
+    response, _ = await generate_text(
+        provider=f"openai{OPENAI_CLIENT}", model=OPENAI_MODEL, prompts=[prompt], edit_func=edit_streamed
+    )
     quoted_response = utils.wrap_in_block_quote(response, "**>", "<**")
-    await message.reply(text="\n".join((quoted_prompt, quoted_response)), parse_mode=ParseMode.MARKDOWN)
+    await reply.edit(text="\n".join((quoted_prompt, quoted_response)), parse_mode=ParseMode.MARKDOWN)
 
 
 @BOT.add_cmd(cmd="igen")
@@ -121,7 +172,9 @@ async def dall_e(bot: BOT, message: Message):
     USAGE:
         .igen cats on moon
     """
-    if DALL_E_CLIENT is None:
+    dall_e_client = get_dall_e_client()
+
+    if dall_e_client is None:
         await message.reply("OpenAI Creds not set or are invalid.\nCheck Help.")
         return
 
@@ -141,7 +194,7 @@ async def dall_e(bot: BOT, message: Message):
         output_res = "1024x1024"
 
     try:
-        generated_image = await DALL_E_CLIENT.images.generate(
+        generated_image = await dall_e_client.images.generate(
             model="dall-e-3",
             prompt=prompt,
             n=1,
@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Iterable
+from typing import Any
+
+RESPONSE_CACHE_TTL = 15 * 60
+RESPONSE_CACHE_SIZE = 256
+
+# provider -> async func(model, prompts, edit_func, **kwargs) that streams a reply into edit_func and returns it.
+TEXT_GENERATORS: dict[str, Callable[..., Awaitable[Any]]] = {}
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.casefold().split())
+
+
+def get_cache_key(provider: str, model: str, prompt: str, attachments: Iterable[str] = (), options: str = "") -> str:
+    """
+    Builds a provider agnostic key from (provider, model, normalized prompt, attachments hash).
+    options holds anything else that changes the answer, like search tools being enabled.
+    """
+    attachments_hash = hashlib.sha256("\n".join(sorted(attachments)).encode()).hexdigest()
+    key = "\0".join((provider, model, options, normalize_prompt(prompt), attachments_hash))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_prompt_and_attachments(prompts: Iterable) -> tuple[str, list[str]]:
+    """Splits plain strings or Gemini parts / files into the prompt text and the uris of attached files."""
+    texts = []
+    attachments = []
+
+    for prompt in prompts:
+        if isinstance(prompt, str):
+            texts.append(prompt)
+        elif isinstance(getattr(prompt, "text", None), str):
+            texts.append(prompt.text)
+        elif getattr(prompt, "file_data", None):
+            attachments.append(prompt.file_data.file_uri)
+        elif getattr(prompt, "uri", None):
+            attachments.append(prompt.uri)
+
+    return "\n".join(texts), attachments
+
+
+class ResponseCache:
+    """
+    LRU cache of AI responses with a TTL.
+    Identical requests arriving while the first one is still running share its result.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_size: int = RESPONSE_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._pending: dict[str, asyncio.Task] = {}
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get_or_create(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        cache_if: Callable[[Any], bool] = bool,
+    ) -> tuple[Any, bool]:
+        """
+        returns:
+            (value, True) if it was served from cache or a concurrent identical request,
+            (value, False) if factory was called.
+        """
+        if (value := self.get(key)) is not None:
+            return value, True
+
+        if task := self._pending.get(key):
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(factory())
+        self._pending[key] = task
+
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            self._pending.pop(key, None)
+
+        if cache_if(value):
+            self.set(key, value)
+
+        return value, False
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+async def generate_text(
+    provider: str,
+    model: str,
+    prompts: list,
+    edit_func: Callable[[str], Awaitable],
+    options: str = "",
+    cache_if: Callable[[Any], bool] = bool,
+    **kwargs,
+) -> tuple[Any, bool]:
+    """
+    info:
+        Streams a text reply from the provider's registered generator,
+        identical requests are answered from RESPONSE_CACHE without calling the provider.
+    args:
+        options: anything besides model and prompts that changes the answer, becomes part of the cache key.
+        kwargs: passed on to the generator.
+    returns:
+        (response, from_cache)
+    """
+    prompt, attachments = get_prompt_and_attachments(prompts)
+    cache_key = get_cache_key(provider, model, prompt, attachments, options)
+
+    async def generate():
+        return await TEXT_GENERATORS[provider](model, prompts, edit_func, **kwargs)
+
+    return await RESPONSE_CACHE.get_or_create(cache_key, generate, cache_if=cache_if)
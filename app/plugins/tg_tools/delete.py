@@ -1,11 +1,15 @@
-import asyncio
-
 from pyrogram.enums import ChatType
 from ub_core.utils.helpers import create_chunks
 
 from app import BOT, Message
+from app.plugins.admin.action_executor import run_admin_action, run_admin_actions
 from app.plugins.tg_tools.get_message import parse_link
 
+# Message ids are per chat only here, in private chats and basic groups they are
+# per account and deleting by id range could hit messages of other chats.
+ID_RANGE_CHAT_TYPES = {ChatType.SUPERGROUP, ChatType.CHANNEL}
+PURGE_CONCURRENCY = 3
+
 
 @BOT.add_cmd(cmd="del")
 async def delete_message(bot: BOT, message: Message) -> None:
@@ -56,6 +60,8 @@ async def purge_(bot: BOT, message: Message) -> None:
     INFO: DELETE MULTIPLE MESSAGES
     USAGE:
         .purge [reply to message]
+    In supergroups and channels the ids between the replied message and the command
+    are deleted in blocks of 100 directly, without reading the history.
     """
     chat_id = message.chat.id
 
@@ -71,6 +77,10 @@ async def purge_(bot: BOT, message: Message) -> None:
         await message.reply("Reply to a message.")
         return
 
+    if message.chat.type in ID_RANGE_CHAT_TYPES and not message.is_topic_message:
+        await purge_id_range(bot, chat_id, start_message, message.id)
+        return
+
     if message.is_topic_message:
         _generator = bot.get_discussion_replies(chat_id=chat_id, message_id=message.message_thread_id)
     else:
@@ -85,8 +95,7 @@ async def purge_(bot: BOT, message: Message) -> None:
 
     async def delete_chunk():
         for chunk in create_chunks(message_ids, chunk_size=100):
-            await bot.delete_messages(chat_id=chat_id, message_ids=chunk, revoke=True)
-            await asyncio.sleep(5)
+            await run_admin_action(lambda: bot.delete_messages(chat_id=chat_id, message_ids=chunk, revoke=True))
 
     last = 0
 
@@ -110,3 +119,22 @@ async def purge_(bot: BOT, message: Message) -> None:
     await delete_chunk()
 
     await message.delete(reply=True)
+
+
+async def purge_id_range(bot: BOT, chat_id: int, start_id: int, end_id: int):
+    """
+    Deletes every id from start_id to end_id (inclusive) in contiguous blocks of 100,
+    a few blocks at a time, slowing down only when Telegram answers with FloodWait.
+    Ids of already deleted or service messages are simply ignored by the server.
+    Blocks that still fail after retries are reported in the log chat.
+    """
+
+    async def delete_block(block_start: int):
+        block = list(range(block_start, min(block_start + 100, end_id + 1)))
+        await bot.delete_messages(chat_id=chat_id, message_ids=block, revoke=True)
+
+    summary = await run_admin_actions(range(start_id, end_id + 1, 100), delete_block, concurrency=PURGE_CONCURRENCY)
+
+    # The command is inside the purged range, so failures go to the log chat instead of a reply.
+    if summary.failed:
+        await bot.log_text(text=f"Purge in [{chat_id}]\n{summary.format('Deleted', 'message blocks')}", type="info")
@@ -21,20 +21,32 @@ from app import BOT, Config, Message, bot, extra_config
 EMOJIS = ("☕", "🤡", "🙂", "🤔", "🔪", "😂", "💀")
 
 
-async def save_sticker(file: Path | BytesIO) -> str:
+async def save_sticker(file: Path | BytesIO) -> raw_types.InputDocument:
     client = getattr(bot, "bot", bot)
 
-    sent_file = await client.send_document(
-        chat_id=Config.LOG_CHAT,
-        document=file,
-        message_thread_id=Config.LOG_CHAT_THREAD_ID,
-        disable_content_type_detection=True,
+    file_name = file.name
+    uploaded_file = await client.save_file(file)
+
+    # Upload straight to TG servers without sending a message to the log chat.
+    media = await client.invoke(
+        functions.messages.UploadMedia(
+            peer=await client.resolve_peer(Config.LOG_CHAT),
+            media=raw_types.InputMediaUploadedDocument(
+                file=uploaded_file,
+                mime_type=client.guess_mime_type(file_name) or "application/octet-stream",
+                force_file=True,
+                attributes=[raw_types.DocumentAttributeFilename(file_name=file_name)],
+            ),
+        )
     )
 
     if isinstance(file, Path) and file.is_file():
         shutil.rmtree(file, ignore_errors=True)
 
-    return sent_file.document.file_id
+    document = media.document
+    return raw_types.InputDocument(
+        id=document.id, access_hash=document.access_hash, file_reference=document.file_reference
+    )
 
 
 def resize_photo(input_file: BytesIO) -> BytesIO:
@@ -49,14 +61,14 @@ def resize_photo(input_file: BytesIO) -> BytesIO:
     return resized_photo
 
 
-async def photo_kang(message: Message, **_) -> tuple[str, None]:
+async def photo_kang(message: Message, **_) -> tuple[raw_types.InputDocument, None]:
     file = await message.download(in_memory=True)
     file.seek(0)
     resized_file = await asyncio.to_thread(resize_photo, file)
     return await save_sticker(resized_file), None
 
 
-async def video_kang(message: Message, ff=False) -> tuple[str, None]:
+async def video_kang(message: Message, ff=False) -> tuple[raw_types.InputDocument, None]:
     video = message.video or message.animation or message.document
 
     if video.file_size > 5242880:
@@ -93,7 +105,7 @@ async def resize_video(input_file: Path | str, output_file: Path | str, duration
     await core_utils.run_shell_cmd(cmd=f"{cmd}'{output_file}'")
 
 
-async def document_kang(message: Message, ff: bool = False) -> tuple[str, None]:
+async def document_kang(message: Message, ff: bool = False) -> tuple[raw_types.InputDocument, None]:
     name, ext = os.path.splitext(core_utils.get_tg_media_details(message).file_name)
     if ext.lower() in core_utils.MediaExtensions.PHOTO:
         return await photo_kang(message)
@@ -101,7 +113,7 @@ async def document_kang(message: Message, ff: bool = False) -> tuple[str, None]:
         return await video_kang(message=message, ff=ff)
 
 
-async def sticker_kang(message: Message, **_) -> tuple[str, str]:
+async def sticker_kang(message: Message, **_) -> tuple[str | raw_types.InputDocument, str]:
     sticker = message.sticker
     if sticker.is_animated:
         raise TypeError("Animated Stickers Not Supported.")
@@ -111,8 +123,8 @@ async def sticker_kang(message: Message, **_) -> tuple[str, str]:
         return sticker.file_id, sticker.emoji
 
     # invalid sticker needs to be saved and added manually
-    file_id = await save_sticker(await message.download(in_memory=True))
-    return file_id, sticker.emoji
+    document = await save_sticker(await message.download(in_memory=True))
+    return document, sticker.emoji
 
 
 MEDIA_TYPE_MAP = {
@@ -154,17 +166,26 @@ async def get_sticker_set(client: BOT, user: User) -> tuple[str, str, bool, raw_
     return shortname, pack_title, create_new, sticker_set
 
 
-async def kang_sticker(client: BOT, media_file_id: str, emoji: str = None, user: User = None) -> BaseStickerSet:
+def get_input_document(media: str | raw_types.InputDocument) -> raw_types.InputDocument:
+    if isinstance(media, raw_types.InputDocument):
+        return media
+
+    file_id = FileId.decode(media)
+    return raw_types.InputDocument(
+        access_hash=file_id.access_hash, id=file_id.media_id, file_reference=file_id.file_reference
+    )
+
+
+async def kang_sticker(
+    client: BOT, media: str | raw_types.InputDocument, emoji: str = None, user: User = None
+) -> BaseStickerSet:
     shortname, pack_title, create_new, sticker_set = await get_sticker_set(client, user)
-    file_id = FileId.decode(media_file_id)
     retry_count = 0
     while retry_count < 2:
-        document = raw_types.InputDocument(
-            access_hash=file_id.access_hash, id=file_id.media_id, file_reference=file_id.file_reference
+        set_item = raw_types.InputStickerSetItem(
+            document=get_input_document(media), emoji=emoji or random.choice(EMOJIS)
         )
 
-        set_item = raw_types.InputStickerSetItem(document=document, emoji=emoji or random.choice(EMOJIS))
-
         if create_new:
             query = functions.stickers.CreateStickerSet(
                 user_id=await bot.resolve_peer(peer_id=user.id),
@@ -180,8 +201,10 @@ async def kang_sticker(client: BOT, media_file_id: str, emoji: str = None, user:
         try:
             return await client.invoke(query)
         except StickerFileInvalid:
-            sent_file_id = await save_sticker(await bot.download_media(file_id, in_memory=True))
-            file_id = FileId.decode(sent_file_id)
+            # Freshly uploaded documents can't be re-downloaded by file_id, re-saving won't help.
+            if not isinstance(media, str):
+                raise
+            media = await save_sticker(await bot.download_media(media, in_memory=True))
             retry_count += 1
             continue
 
@@ -214,13 +237,13 @@ async def kang(bot: BOT, message: Message):
 
     bot = getattr(bot, "bot", bot)
 
-    file_id, emoji = await media_func(message=replied, ff="-f" in message.flags)
+    media, emoji = await media_func(message=replied, ff="-f" in message.flags)
 
     if message.filtered_input:
         emoji = message.filtered_input
 
     try:
-        stickers = await kang_sticker(bot, file_id, emoji, user=message.from_user)
+        stickers = await kang_sticker(bot, media, emoji, user=message.from_user)
         await response.edit(
             text=f"Kanged: <a href='t.me/addstickers/{stickers.set.short_name}'>here</a>", disable_preview=True
         )